@@ -0,0 +1,94 @@
+"""Scan results kept between runs, so a rescan can skip fresh hosts and report only what changed.
+
+Per host the store keeps the last state, when it was scanned and which ports
+were; per open port, its service and when it was first and last seen open.
+Closed and filtered ports aren't stored: a port the last scan covered that
+isn't open now has closed, so a thousand-port sweep stores only a handful of
+rows per host.
+"""
+import functools
+import sqlite3
+import time
+from collections import namedtuple
+
+from scanning import parse_ports
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    ports TEXT NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS open_ports (
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (host, port)
+) WITHOUT ROWID;
+"""
+
+# opened is [(port, service)] open now but not last time; closed is [(port, service)] the other way round.
+# previous_state is None the first time a host is seen.
+HostChange = namedtuple('HostChange', 'host state previous_state opened closed')
+
+
+@functools.lru_cache(maxsize=64)
+def _port_set(spec):
+    return frozenset(parse_ports(spec))
+
+
+class ScanStore:
+    def __init__(self, path, commit_every=500):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.commit_every = commit_every
+        self._uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fresh_hosts(self, spec, ttl):
+        """Hosts scanned for exactly the ports in spec (as format_ports writes them) within the last ttl seconds."""
+        rows = self.conn.execute('SELECT host FROM hosts WHERE ports = ? AND scanned_at >= ?',
+                                 (spec, time.time() - ttl))
+        return {host for (host,) in rows}
+
+    def record(self, result, spec):
+        """Store a HostResult from a scan of the ports in spec and return how it differs from the last one."""
+        now = time.time()
+        previous = self.conn.execute('SELECT state FROM hosts WHERE host = ?', (result.host,)).fetchone()
+        self.conn.execute('INSERT INTO hosts (host, state, ports, scanned_at) VALUES (?, ?, ?, ?) '
+                          'ON CONFLICT (host) DO UPDATE SET state = excluded.state, ports = excluded.ports, '
+                          'scanned_at = excluded.scanned_at', (result.host, result.state, spec, now))
+        previous_state = previous[0] if previous else None
+        opened, closed = [], []
+        if result.state == 'up':
+            # A host that didn't answer says nothing about its ports, so those are only compared when it's up
+            known = dict(self.conn.execute('SELECT port, name FROM open_ports WHERE host = ?', (result.host,)))
+            open_now = {port: info['name'] for port, info in result.ports.items() if info['state'] == 'open'}
+            scanned = _port_set(spec)
+            opened = sorted((port, name) for port, name in open_now.items() if port not in known)
+            closed = sorted((port, name) for port, name in known.items() if port in scanned and port not in open_now)
+            self.conn.executemany('DELETE FROM open_ports WHERE host = ? AND port = ?',
+                                  [(result.host, port) for port, _ in closed])
+            self.conn.executemany('INSERT INTO open_ports (host, port, name, first_seen, last_seen) '
+                                  'VALUES (?, ?, ?, ?, ?) ON CONFLICT (host, port) DO UPDATE SET '
+                                  'name = excluded.name, last_seen = excluded.last_seen',
+                                  [(result.host, port, name, now, now) for port, name in open_now.items()])
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.conn.commit()
+            self._uncommitted = 0
+        return HostChange(result.host, result.state, previous_state, opened, closed)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,182 @@
+"""Port scanning over many hosts, with results streamed per host as they complete.
+
+Two engines produce the same HostResult records:
+
+nmap     chunks of hosts handed to python-nmap PortScanner in a process pool
+connect  a pure-Python asyncio TCP connect scan, for when nmap isn't installed
+"""
+import asyncio
+import functools
+import ipaddress
+import itertools
+import logging
+import os
+import socket
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+try:
+    import nmap
+except ImportError:
+    nmap = None
+
+# ports maps each scanned port to {'state': 'open' | 'closed' | 'filtered', 'name': service}, as nmap reports it
+HostResult = namedtuple('HostResult', 'host state ports elapsed')
+
+logger = logging.getLogger('nmap.scanning')
+
+
+def expand_targets(specs):
+    """Hosts to scan from CIDR ranges ('10.0.0.0/24'), addresses and hostnames, lazily and without repeats."""
+    seen = set()
+    for spec in specs:
+        spec = spec.strip()
+        if not spec or spec.startswith('#'):
+            continue
+        try:
+            network = ipaddress.ip_network(spec, strict=False)
+        except ValueError:
+            hosts = [spec]  # a hostname; nmap and the connect scan both resolve it
+        else:
+            # hosts() leaves out the network and broadcast addresses, except for /31 and /32 where there are none
+            hosts = map(str, network.hosts() if network.num_addresses > 2 else network)
+        for host in hosts:
+            if host not in seen:
+                seen.add(host)
+                yield host
+
+
+def parse_ports(spec):
+    """Sorted port numbers from nmap-style '22,80,8000-8100'."""
+    ports = set()
+    for part in spec.split(','):
+        first, _, last = part.strip().partition('-')
+        first, last = int(first), int(last or first)
+        if not 0 < first <= last <= 65535:
+            raise ValueError(f'bad port range {part!r}')
+        ports.update(range(first, last + 1))
+    return sorted(ports)
+
+
+def format_ports(ports):
+    """The inverse of parse_ports, collapsing runs back into ranges for nmap's -p."""
+    ranges = []
+    for _, run in itertools.groupby(enumerate(ports), lambda item: item[1] - item[0]):
+        run = [port for _, port in run]
+        ranges.append(str(run[0]) if len(run) == 1 else f'{run[0]}-{run[-1]}')
+    return ','.join(ranges)
+
+
+def chunked(items, size):
+    items = iter(items)
+    while chunk := list(itertools.islice(items, size)):
+        yield chunk
+
+
+@functools.lru_cache(maxsize=None)
+def service_name(port):
+    try:
+        return socket.getservbyport(port, 'tcp')
+    except OSError:
+        return ''
+
+
+def nmap_available():
+    if nmap is None:
+        return False
+    try:
+        nmap.PortScanner()  # raises when the nmap program isn't on PATH
+    except nmap.PortScannerError:
+        return False
+    return True
+
+
+def _nmap_chunk(hosts, ports, arguments):
+    """Runs in a worker process: one nmap invocation over a chunk of hosts."""
+    start = time.perf_counter()
+    scanner = nmap.PortScanner()
+    scanner.scan(hosts=' '.join(hosts), ports=ports, arguments=arguments)
+    elapsed = time.perf_counter() - start
+    results = []
+    reported = set()
+    for host in scanner.all_hosts():
+        found = scanner[host]
+        scanned = {port: {'state': info['state'], 'name': info['name']} for port, info in found.get('tcp', {}).items()}
+        results.append(HostResult(host, found.state(), scanned, elapsed))
+        reported.add(host)
+        reported.update(name['name'] for name in found.get('hostnames', ()))  # results are keyed by address
+    # Hosts nmap found down are left out of its results; report them rather than dropping them silently
+    results.extend(HostResult(host, 'down', {}, elapsed) for host in hosts if host not in reported)
+    return results
+
+
+def nmap_scan(targets, ports, workers=None, chunk_size=16, arguments='-T4'):
+    """Scan with nmap, chunk_size hosts per invocation and workers invocations at once; yields HostResults
+    chunk by chunk as each finishes. Only a few chunks are queued ahead, so huge ranges stream in constant memory."""
+    ports = format_ports(ports)
+    workers = workers or os.cpu_count()
+    chunks = chunked(targets, chunk_size)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = {}
+
+        def submit(count):
+            for chunk in itertools.islice(chunks, count):
+                pending[pool.submit(_nmap_chunk, chunk, ports, arguments)] = chunk
+
+        submit(2 * workers)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = pending.pop(future)
+                try:
+                    yield from future.result()
+                except Exception as e:
+                    # One failed invocation shouldn't end a scan of a whole range
+                    logger.error('nmap failed on %s..%s: %s', chunk[0], chunk[-1], e)
+            submit(len(done))
+
+
+async def connect_scan(targets, ports, concurrency=512, timeout=1.0):
+    """Scan by completing TCP handshakes, at most concurrency at once; yields a HostResult per host as each finishes.
+
+    A port that accepts is open and one that refuses is closed; no answer within
+    timeout counts as filtered. A host with every port filtered is reported down.
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def probe(host, port):
+        async with limit:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            except ConnectionRefusedError:
+                return 'closed'
+            except (asyncio.TimeoutError, OSError):
+                return 'filtered'
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return 'open'
+
+    async def scan_host(host):
+        start = time.perf_counter()
+        states = await asyncio.gather(*(probe(host, port) for port in ports))
+        scanned = {port: {'state': state, 'name': service_name(port)} for port, state in zip(ports, states)}
+        up = any(state != 'filtered' for state in states)
+        return HostResult(host, 'up' if up else 'down', scanned, time.perf_counter() - start)
+
+    # Start hosts lazily, enough to keep every connection slot busy, instead of a task per host of the range
+    hosts = iter(targets)
+    in_flight = 2 * max(1, concurrency // max(len(ports), 1))
+    pending = {asyncio.ensure_future(scan_host(host)) for host in itertools.islice(hosts, in_flight)}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+            pending.update(asyncio.ensure_future(scan_host(host)) for host in itertools.islice(hosts, len(done)))
+    finally:
+        for task in pending:
+            task.cancel()
@@ -1,8 +1,132 @@
-import nmap
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
 
-scanner = nmap.PortScanner()
+from results import ScanStore
+from scanning import connect_scan, expand_targets, format_ports, nmap_available, nmap_scan, parse_ports
 
-print('Welcome, this is a simple nmap automation tool')
-print('<----------------------------------------------------------->')
-ip_addr = input('Please enter ip address you want to scan: ')
-print('The ip you entered is: ',ip_addr)
\ No newline at end of file
+
+def show(result, args):
+    if args.json:
+        print(json.dumps(result._asdict()), flush=True)
+        return
+    listed = [f"{port}/{info['state']}" + (f" ({info['name']})" if info['name'] else '')
+              for port, info in sorted(result.ports.items()) if args.all or info['state'] == 'open']
+    print(f"{result.host:<40} {result.state:<5} {', '.join(listed) or '-'}", flush=True)
+
+
+def show_change(change, args):
+    if args.json:
+        print(json.dumps(change._asdict()), flush=True)
+        return
+    state = change.state
+    if change.previous_state not in (None, change.state):
+        state += f' (was {change.previous_state})'
+    listed = [f'+{port}' + (f' ({name})' if name else '') for port, name in change.opened]
+    listed += [f'-{port}' + (f' ({name})' if name else '') for port, name in change.closed]
+    print(f"{change.host:<40} {state:<5} {', '.join(listed) or '-'}", flush=True)
+
+
+def changed(change):
+    if change.opened or change.closed:
+        return True
+    return change.previous_state is not None and change.previous_state != change.state
+
+
+async def consume(results, record):
+    async for result in results:
+        record(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='A simple nmap automation tool')
+    parser.add_argument('targets', nargs='*', help="addresses, CIDR ranges ('192.168.1.0/24') or hostnames")
+    parser.add_argument('-i', '--targets-file', help="file of targets, one per line ('-' for stdin)")
+    parser.add_argument('-p', '--ports', default='1-1024', help="ports to scan, e.g. '22,80,8000-8100'")
+    parser.add_argument('--engine', choices=('auto', 'nmap', 'connect'), default='auto',
+                        help='auto uses nmap when it is installed and the asyncio connect scan otherwise')
+    parser.add_argument('--workers', type=int, help='nmap processes at once (default: one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=16, help='hosts per nmap invocation')
+    parser.add_argument('--arguments', default='-T4', help='extra nmap arguments')
+    parser.add_argument('--concurrency', type=int, default=512, help='connections at once in the connect scan')
+    parser.add_argument('--timeout', type=float, default=1.0, help='seconds before a connect counts as filtered')
+    parser.add_argument('--all', action='store_true', help='list closed and filtered ports too')
+    parser.add_argument('--json', action='store_true', help='print one JSON object per host')
+    parser.add_argument('--db', default='scans.db', help='where results are kept between runs')
+    parser.add_argument('--no-db', action='store_true', help="don't read or keep previous results")
+    parser.add_argument('--ttl', type=float, default=0,
+                        help='skip hosts already scanned for the same ports within this many seconds')
+    parser.add_argument('--diff', action='store_true', help='only show ports opened or closed since the last scan')
+    args = parser.parse_args()
+    if args.no_db and (args.ttl or args.diff):
+        parser.error('--ttl and --diff need the results kept by --db')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    specs = list(args.targets)
+    if args.targets_file:
+        with (sys.stdin if args.targets_file == '-' else open(args.targets_file)) as f:
+            specs.extend(f.read().split())
+    if not specs:
+        print('Welcome, this is a simple nmap automation tool')
+        print('<----------------------------------------------------------->')
+        ip_addr = input('Please enter ip address you want to scan: ')
+        print('The ip you entered is: ', ip_addr)
+        specs = ip_addr.split()
+    targets = expand_targets(specs)
+    ports = parse_ports(args.ports)
+    engine = args.engine
+    if engine == 'auto':
+        engine = 'nmap' if nmap_available() else 'connect'
+    elif engine == 'nmap' and not nmap_available():
+        parser.error('nmap is not installed; use --engine connect')
+    logging.info('scanning %s ports per host with the %s engine', len(ports), engine)
+
+    spec = format_ports(ports)
+    store = None if args.no_db else ScanStore(args.db)
+    counts = {'hosts': 0, 'up': 0, 'open': 0, 'skipped': 0, 'changed': 0}
+    if store and args.ttl:
+        fresh = store.fresh_hosts(spec, args.ttl)
+
+        def unscanned(hosts):
+            for host in hosts:
+                if host in fresh:
+                    counts['skipped'] += 1
+                else:
+                    yield host
+
+        targets = unscanned(targets)
+
+    def record(result):
+        counts['hosts'] += 1
+        counts['up'] += result.state == 'up'
+        counts['open'] += sum(info['state'] == 'open' for info in result.ports.values())
+        change = store.record(result, spec) if store else None
+        if change and changed(change):
+            counts['changed'] += 1
+        if not args.diff:
+            show(result, args)
+        elif changed(change):
+            show_change(change, args)
+
+    start = time.perf_counter()
+    try:
+        if engine == 'nmap':
+            for result in nmap_scan(targets, ports, args.workers, args.chunk_size, args.arguments):
+                record(result)
+        else:
+            asyncio.run(consume(connect_scan(targets, ports, args.concurrency, args.timeout), record))
+    except KeyboardInterrupt:
+        logging.info('interrupted')
+    finally:
+        if store:
+            store.close()
+    logging.info('%s hosts scanned (%s up, %s open ports, %s changed), %s skipped as fresh, in %.1fs',
+                 counts['hosts'], counts['up'], counts['open'], counts['changed'], counts['skipped'],
+                 time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,17 @@
 import socket
 
+from pool import ConnectionPool
+
 
 DEST_IP = socket.gethostbyname(socket.gethostname())
 DEST_PORT = 12345
 ENCODER = 'utf-8'
-BYTESIZE = 1024
-
-client_socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-
-client_socket.connect((socket.gethostbyname(socket.gethostname()),12345))
-message = client_socket.recv(BYTESIZE)
-
-client_socket.close()
-
-print(message.decode(ENCODER))
 
+# One kept-alive connection carries the greeting and every request after it
+with ConnectionPool(DEST_IP, DEST_PORT, max_size=1) as pool:
+    with pool.connection() as connection:
+        print(connection.greeting.decode(ENCODER))
+        reply = connection.request('ping'.encode(ENCODER))
+        print(reply.decode(ENCODER))
+        replies = connection.pipeline([f'ping {i}'.encode(ENCODER) for i in range(3)])
+        print(', '.join(reply.decode(ENCODER) for reply in replies))
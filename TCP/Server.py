@@ -1,4 +1,14 @@
+import argparse
+import asyncio
+import logging
+import signal
 import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from framing import FrameBuffer, FrameReader, FrameTooLarge, encode_frame, send_frame
 
 
 HOST_IP = socket.gethostbyname(socket.gethostname())
@@ -6,19 +16,267 @@ HOST_PORT = 12345
 ENCODER = 'utf-8'
 BYTESIZE = 1024
 
-server_socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+# Encoded and framed once; every connection is sent the same bytes
+GREETING = ('hello thank you for connecting to the server' + '\r\n').encode(ENCODER)
+GREETING_FRAME = encode_frame(GREETING)
+
+logger = logging.getLogger('tcp.server')
+
+
+class ServerStats:
+    """Connection counters and recent latencies, shared by the accept loop and the handlers."""
+
+    def __init__(self, samples=10000):
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.served = 0
+        self.failed = 0
+        self.active = 0
+        self.requests = 0
+        self.latencies = deque(maxlen=samples)  # seconds from accept to close
+        self._last_accepted = 0
+        self._last_time = time.monotonic()
+
+    def opened(self):
+        with self.lock:
+            self.accepted += 1
+            self.active += 1
+
+    def answered(self, count=1):
+        with self.lock:
+            self.requests += count
+
+    def closed(self, seconds, ok=True):
+        with self.lock:
+            self.active -= 1
+            if ok:
+                self.served += 1
+            else:
+                self.failed += 1
+            self.latencies.append(seconds)
+
+    def summary(self):
+        with self.lock:
+            now = time.monotonic()
+            rate = (self.accepted - self._last_accepted) / max(now - self._last_time, 1e-9)
+            self._last_accepted, self._last_time = self.accepted, now
+            latencies = sorted(self.latencies)
+            counts = (self.accepted, self.served, self.failed, self.active, self.requests)
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+        return ('accepted=%s served=%s failed=%s active=%s requests=%s rate=%.0f/s p50=%.2fms p99=%.2fms'
+                % (*counts, rate, p50, p99))
+
+
+def respond(request):
+    """The reply to one request frame; this server echoes it back.
+
+    request is a memoryview into the connection's receive buffer, valid only
+    until the next read: copy it (bytes(request)) to keep it past the reply."""
+    return request
+
+
+class GreetingProtocol(asyncio.BufferedProtocol):
+    """Greets the client, then answers each request frame in order until the client hangs up.
+
+    Connections are kept alive between requests, and pipelined requests that
+    arrive together are answered with one write. Requests are received straight
+    into a FrameBuffer and answered from views of it, without a copy per read. A connection is closed once it
+    has been idle for idle_timeout seconds or has not taken its replies within
+    timeout seconds.
+    """
+
+    def __init__(self, stats, connections, timeout, idle_timeout):
+        self.stats = stats
+        self.connections = connections
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.frames = FrameBuffer()
+        self.transport = None
+        self.started = None
+        self.last_active = None
+        self.timer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.started = self.last_active = time.perf_counter()
+        self.stats.opened()
+        self.connections.add(self)
+        logger.debug('received connection from %s', transport.get_extra_info('peername'))
+        transport.write(GREETING_FRAME)
+        self.timer = asyncio.get_running_loop().call_later(self.idle_timeout, self._check_idle)
+
+    def get_buffer(self, sizehint):
+        return self.frames.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        self.last_active = time.perf_counter()
+        try:
+            requests = self.frames.frames(nbytes)
+        except FrameTooLarge as e:
+            logger.debug('closing %s: %s', self.transport.get_extra_info('peername'), e)
+            self.transport.abort()
+            return
+        if requests:
+            self.transport.writelines([encode_frame(respond(request)) for request in requests])
+            self.stats.answered(len(requests))
+
+    def eof_received(self):
+        return False  # close once the replies already written are flushed
+
+    def pause_writing(self):
+        # The client isn't reading its replies; stop reading its requests until it catches up
+        self.transport.pause_reading()
+        self.timer.cancel()
+        self.timer = asyncio.get_running_loop().call_later(self.timeout, self.transport.abort)
+
+    def resume_writing(self):
+        self.transport.resume_reading()
+        self.timer.cancel()
+        self.timer = asyncio.get_running_loop().call_later(self.idle_timeout, self._check_idle)
+
+    def _check_idle(self):
+        # One timer per connection, re-armed lazily instead of on every request
+        idle = time.perf_counter() - self.last_active
+        if idle >= self.idle_timeout:
+            self.transport.close()
+        else:
+            self.timer = asyncio.get_running_loop().call_later(self.idle_timeout - idle, self._check_idle)
+
+    def connection_lost(self, exc):
+        self.timer.cancel()
+        self.connections.discard(self)
+        self.stats.closed(time.perf_counter() - self.started, exc is None)
+
+
+async def serve_asyncio(host, port, backlog, stats, timeout=10, idle_timeout=60, stats_interval=10):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    connections = set()
+    server = await loop.create_server(lambda: GreetingProtocol(stats, connections, timeout, idle_timeout), host, port,
+                                      backlog=backlog, reuse_address=True)
+    logger.info('listening on %s:%s (asyncio, backlog %s)', host, port, backlog)
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), stats_interval or None)
+        except asyncio.TimeoutError:
+            logger.info(stats.summary())
+
+    # Graceful shutdown: stop accepting, close kept-alive connections once their replies
+    # are flushed, and abort whatever is still open after timeout
+    server.close()
+    for protocol in list(connections):
+        protocol.transport.close()
+    deadline = loop.time() + timeout
+    while connections and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+    for protocol in list(connections):
+        protocol.transport.abort()
+    await server.wait_closed()
+
+
+def handle_client(client_socket, client_address, stats, timeout, idle_timeout):
+    started = time.perf_counter()
+    ok = True
+    try:
+        logger.debug('received connection from %s', client_address)
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # replies are small and awaited
+        client_socket.settimeout(timeout)  # a client that never reads can't hold a worker forever
+        client_socket.sendall(GREETING_FRAME)
+        reader = FrameReader(client_socket)
+        while True:
+            client_socket.settimeout(idle_timeout)
+            request = reader.recv_frame()
+            if request is None:
+                break
+            client_socket.settimeout(timeout)
+            send_frame(client_socket, respond(request))
+            stats.answered()
+    except socket.timeout:
+        logger.debug('closing idle connection from %s', client_address)
+    except (OSError, FrameTooLarge) as e:
+        ok = False
+        logger.debug('connection from %s failed: %s', client_address, e)
+    finally:
+        client_socket.close()
+        stats.closed(time.perf_counter() - started, ok)
+
+
+def serve_threads(host, port, backlog, stats, workers=64, timeout=10, idle_timeout=60, stats_interval=10):
+    """Thread-per-connection serving. A kept-alive connection holds its worker, so at most
+    workers clients are served at once and the rest wait in the pool's queue."""
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(backlog)
+    server_socket.settimeout(0.5)  # wake up regularly to notice a shutdown request
+    logger.info('listening on %s:%s (%s threads, backlog %s)', host, port, workers, backlog)
+    clients = set()
+    clients_lock = threading.Lock()
 
-server_socket.bind((HOST_IP,HOST_PORT))
+    def serve_client(client_socket, client_address):
+        try:
+            handle_client(client_socket, client_address, stats, timeout, idle_timeout)
+        finally:
+            with clients_lock:
+                clients.discard(client_socket)
 
-server_socket.listen()
+    next_report = time.monotonic() + stats_interval
+    with ThreadPoolExecutor(workers, 'tcp-worker') as pool:
+        while not stop.is_set():
+            if stats_interval and time.monotonic() >= next_report:
+                logger.info(stats.summary())
+                next_report += stats_interval
+            try:
+                client_socket, client_address = server_socket.accept()
+            except socket.timeout:
+                continue
+            except InterruptedError:
+                continue
+            stats.opened()
+            with clients_lock:
+                clients.add(client_socket)
+            pool.submit(serve_client, client_socket, client_address)
+        # Graceful shutdown: stop accepting and end kept-alive connections at their next read;
+        # leaving the with block waits for requests in progress
+        server_socket.close()
+        with clients_lock:
+            for client_socket in clients:
+                try:
+                    client_socket.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
 
 
+def main():
+    parser = argparse.ArgumentParser(description='Greeting and echo server')
+    parser.add_argument('--host', default=HOST_IP)
+    parser.add_argument('--port', type=int, default=HOST_PORT)
+    parser.add_argument('--mode', choices=('asyncio', 'threads'), default='asyncio')
+    parser.add_argument('--backlog', type=int, default=socket.SOMAXCONN, help='pending connections the kernel queues')
+    parser.add_argument('--workers', type=int, default=64, help='thread pool size in threads mode')
+    parser.add_argument('--timeout', type=float, default=10, help='seconds a client gets to take its replies')
+    parser.add_argument('--idle-timeout', type=float, default=60, help='seconds a kept-alive connection may sit idle')
+    parser.add_argument('--stats-interval', type=float, default=10, help='seconds between counter logs; 0 disables')
+    parser.add_argument('--verbose', action='store_true', help='log every connection')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
 
-while True:
-    client_socket, client_address = server_socket.accept()
-    print('received connection from %s' % str(client_address))
+    stats = ServerStats()
+    if args.mode == 'asyncio':
+        asyncio.run(serve_asyncio(args.host, args.port, args.backlog, stats, args.timeout, args.idle_timeout,
+                                  args.stats_interval))
+    else:
+        serve_threads(args.host, args.port, args.backlog, stats, args.workers, args.timeout, args.idle_timeout,
+                      args.stats_interval)
+    logger.info('stopped: %s', stats.summary())
 
-    message = 'hello thank you for connecting to the server'+ '\r\n'
-    client_socket.send(message.encode(ENCODER))
 
-    client_socket.close()
+if __name__ == '__main__':
+    main()
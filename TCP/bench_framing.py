@@ -0,0 +1,104 @@
+"""Benchmark: message throughput over loopback TCP, old recv(BYTESIZE) path vs framing.
+
+legacy   send() until done, then recv(BYTESIZE) chunks joined into a new bytes
+         object; the receiver must already know the size, and with the old
+         single recv() anything past BYTESIZE was lost
+framed   send_frame() / FrameReader.recv_frame() through one reusable buffer
+stream   send_frame() / FrameReader.recv_stream(), never holding a whole payload
+
+Run from the TCP directory: python bench_framing.py
+"""
+import socket
+import threading
+import time
+
+from framing import FrameReader, send_frame
+
+BYTESIZE = 1024
+CASES = [(100, 100_000), (16 << 10, 20_000), (8 << 20, 40)]  # (payload bytes, messages)
+
+
+def legacy_send(sock, payload, count):
+    for _ in range(count):
+        view = memoryview(payload)
+        while view:
+            view = view[sock.send(view):]
+
+
+def legacy_recv(sock, size, count):
+    pending = b''
+    for _ in range(count):
+        chunks = [pending]
+        received = len(pending)
+        while received < size:
+            chunk = sock.recv(BYTESIZE)
+            chunks.append(chunk)
+            received += len(chunk)
+        data = b''.join(chunks)
+        pending = data[size:]  # the next message's start, when two arrived in one recv
+
+
+def framed_send(sock, payload, count):
+    for _ in range(count):
+        send_frame(sock, payload)
+
+
+def framed_recv(sock, size, count):
+    reader = FrameReader(sock)
+    for _ in range(count):
+        reader.recv_frame()
+
+
+def stream_recv(sock, size, count):
+    reader = FrameReader(sock)
+    for _ in range(count):
+        for _ in reader.recv_stream():
+            pass
+
+
+def measure(send, recv, size, count):
+    server = socket.create_server(('127.0.0.1', 0))
+    payload = bytes(size)
+
+    def serve():
+        conn, _ = server.accept()
+        send(conn, payload, count)
+        conn.close()
+
+    sender = threading.Thread(target=serve)
+    sender.start()
+    client = socket.create_connection(server.getsockname())
+    start = time.perf_counter()
+    recv(client, size, count)
+    elapsed = time.perf_counter() - start
+    sender.join()
+    client.close()
+    server.close()
+    return elapsed
+
+
+def truncated(size):
+    """Bytes a single recv(BYTESIZE), as the old client did, returns of a size-byte message."""
+    server = socket.create_server(('127.0.0.1', 0))
+    client = socket.create_connection(server.getsockname())
+    conn, _ = server.accept()
+    conn.setblocking(False)
+    conn.send(bytes(size))  # as much as the socket buffers take; nobody reads the rest
+    time.sleep(0.05)
+    got = len(client.recv(BYTESIZE))
+    for sock in (conn, client, server):
+        sock.close()
+    return got
+
+
+def main():
+    for size, count in CASES:
+        print(f"{size} byte messages x {count} (old single recv kept {truncated(size)} bytes of each)")
+        for name, send, recv in (('legacy', legacy_send, legacy_recv), ('framed', framed_send, framed_recv),
+                                 ('stream', framed_send, stream_recv)):
+            elapsed = measure(send, recv, size, count)
+            print(f"  {name:<8} {count / elapsed:>10.0f} msg/s {size * count / elapsed / 2 ** 20:>9.0f} MiB/s")
+
+
+if __name__ == '__main__':
+    main()
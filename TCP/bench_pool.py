@@ -0,0 +1,119 @@
+"""Benchmark: requests/sec against Server.py with and without connection reuse.
+
+fresh      what Client.py used to do: resolve the host, connect, read the greeting,
+           send one request, read the reply, close
+pooled     ConnectionPool.request() on kept-alive connections, one at a time
+pipelined  ConnectionPool.pipeline() in batches of --batch requests
+threaded   ConnectionPool.request() from --threads threads sharing one pool
+
+The server is started as a subprocess on a free loopback port, in --mode.
+
+Run from the TCP directory: python bench_pool.py [--mode threads] [--seconds 2]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from framing import FrameReader, send_frame
+from pool import ConnectionPool
+
+HOST = 'localhost'
+PAYLOAD = b'x' * 64
+
+
+def start_server(mode):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Server.py'),
+                               '--host', '127.0.0.1', '--port', str(port), '--mode', mode, '--stats-interval', '0'])
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return server, port
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                server.kill()
+                raise
+            time.sleep(0.05)
+
+
+def fresh(port, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        address = socket.gethostbyname(HOST)
+        with socket.create_connection((address, port)) as sock:
+            reader = FrameReader(sock)
+            reader.recv_frame()
+            send_frame(sock, PAYLOAD)
+            reader.recv_frame()
+        count += 1
+    return count
+
+
+def pooled(pool, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pool.request(PAYLOAD)
+        count += 1
+    return count
+
+
+def pipelined(pool, seconds, batch):
+    count = 0
+    payloads = [PAYLOAD] * batch
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        count += len(pool.pipeline(payloads))
+    return count
+
+
+def threaded(pool, seconds, threads):
+    counts = [0] * threads
+
+    def worker(index):
+        counts[index] = pooled(pool, seconds)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--mode', choices=('asyncio', 'threads'), default='asyncio', help="the server's mode")
+    parser.add_argument('--seconds', type=float, default=2, help='duration of each case')
+    parser.add_argument('--batch', type=int, default=64, help='requests per pipeline() call')
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    server, port = start_server(args.mode)
+    try:
+        with ConnectionPool(HOST, port, max_size=args.threads) as pool:
+            cases = [('fresh', lambda: fresh(port, args.seconds)),
+                     ('pooled', lambda: pooled(pool, args.seconds)),
+                     (f'pipelined x{args.batch}', lambda: pipelined(pool, args.seconds, args.batch)),
+                     (f'threaded x{args.threads}', lambda: threaded(pool, args.seconds, args.threads))]
+            print(f"{len(PAYLOAD)} byte echo requests, server in {args.mode} mode")
+            for name, case in cases:
+                start = time.perf_counter()
+                count = case()
+                elapsed = time.perf_counter() - start
+                print(f"  {name:<14} {count / elapsed:>10.0f} req/s {elapsed / count * 1e6:>9.1f} us/req")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
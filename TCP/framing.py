@@ -0,0 +1,195 @@
+"""Length-prefixed messages over a stream socket.
+
+Each frame is a 4-byte big-endian payload length followed by the payload, so a
+receiver always knows where a message ends no matter how TCP splits it up.
+"""
+import struct
+
+HEADER = struct.Struct('!I')
+MAX_FRAME = 1 << 30  # refuse lengths that are clearly not ours instead of allocating them
+SMALL_FRAME = 1 << 16  # below this, header and payload go out in one send
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+def encode_frame(payload):
+    """Header and payload as one bytes object, for messages sent many times (encode once)."""
+    if len(payload) > MAX_FRAME:
+        raise FrameTooLarge(f'{len(payload)} byte frame exceeds {MAX_FRAME}')
+    return HEADER.pack(len(payload)) + payload
+
+
+def send_frame(sock, payload):
+    """Send one frame; payload is any bytes-like object of single bytes (bytes, bytearray, memoryview)."""
+    size = len(payload)
+    if size <= SMALL_FRAME:
+        sock.sendall(HEADER.pack(size) + payload)  # one syscall; copying a small payload is cheaper than two
+    else:
+        if size > MAX_FRAME:
+            raise FrameTooLarge(f'{size} byte frame exceeds {MAX_FRAME}')
+        sock.sendall(HEADER.pack(size))
+        sock.sendall(payload)
+
+
+def send_stream(sock, chunks, length):
+    """Send one frame of length bytes from an iterable of bytes-like chunks, e.g. a file read piecewise."""
+    if length > MAX_FRAME:
+        raise FrameTooLarge(f'{length} byte frame exceeds {MAX_FRAME}')
+    sock.sendall(HEADER.pack(length))
+    sent = 0
+    for chunk in chunks:
+        sent += len(chunk)
+        if sent > length:
+            raise ValueError(f'stream is longer than the {length} bytes announced')
+        sock.sendall(chunk)
+    if sent != length:
+        # The peer is now waiting for bytes that will never come; the connection can't be reused
+        raise ValueError(f'stream ended after {sent} of the {length} bytes announced')
+
+
+class FrameReader:
+    """Reads frames from a socket through one reusable buffer.
+
+    recv_into() fills the buffer with whatever has arrived, often several small
+    frames at once, and frames are handed out as memoryviews into it, so
+    steady-state reads allocate nothing. A view is only valid until the next read;
+    bytes(view) keeps a copy. recv_frame() grows the buffer to fit a frame larger
+    than it; recv_stream() streams such a frame through the buffer instead.
+    """
+
+    def __init__(self, sock, buffer_size=SMALL_FRAME, max_frame=MAX_FRAME):
+        self.sock = sock
+        self.max_frame = max_frame
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # unread bytes are _buffer[_start:_end]
+        self._end = 0
+
+    def _fill(self, size):
+        """Make at least size unread bytes available; returns False on a clean EOF before any of them."""
+        if self._start + size > len(self._buffer):
+            unread = self._end - self._start
+            if size > len(self._buffer):
+                buffer = bytearray(max(size, 2 * len(self._buffer)))
+                buffer[:unread] = self._view[self._start:self._end]
+                self._buffer, self._view = buffer, memoryview(buffer)
+            else:
+                self._view[:unread] = self._view[self._start:self._end]
+            self._start, self._end = 0, unread
+        while self._end - self._start < size:
+            received = self.sock.recv_into(self._view[self._end:])
+            if not received:
+                if self._end == self._start:
+                    return False
+                raise ConnectionError(f'connection closed {self._end - self._start} bytes into a frame')
+            self._end += received
+        return True
+
+    def _read_length(self):
+        if not self._fill(HEADER.size):
+            return None
+        (length,) = HEADER.unpack_from(self._buffer, self._start)
+        if length > self.max_frame:
+            raise FrameTooLarge(f'peer announced a {length} byte frame, limit is {self.max_frame}')
+        self._start += HEADER.size
+        return length
+
+    def recv_frame(self):
+        """Next payload as a memoryview, or None once the peer has closed the connection."""
+        start = self._start + HEADER.size
+        if start <= self._end:
+            # Fast path: the whole frame is already buffered, as it usually is for small ones
+            (length,) = HEADER.unpack_from(self._buffer, self._start)
+            end = start + length
+            if end <= self._end and length <= self.max_frame:
+                self._start = end
+                return self._view[start:end]
+        length = self._read_length()
+        if length is None:
+            return None
+        if not self._fill(length) and length:
+            raise ConnectionError('connection closed before the frame payload')
+        frame = self._view[self._start:self._start + length]
+        self._start += length
+        return frame
+
+    def recv_stream(self):
+        """Next payload as an iterator of memoryviews of at most the buffer size, or None
+        once the peer has closed the connection. Exhaust it before reading the next frame."""
+        length = self._read_length()
+        if length is None:
+            return None
+        return self._chunks(length)
+
+    def _chunks(self, remaining):
+        while remaining:
+            if self._end == self._start:
+                self._start = self._end = 0
+                if not self._fill(1):
+                    raise ConnectionError(f'connection closed with {remaining} frame bytes outstanding')
+            size = min(remaining, self._end - self._start)
+            chunk = self._view[self._start:self._start + size]
+            self._start += size
+            remaining -= size
+            yield chunk
+
+
+class FrameBuffer:
+    """Incremental framing through one reusable buffer, for asyncio.BufferedProtocol.
+
+    get_buffer() returns the free space at the end of the buffer for the
+    transport to receive into; frames(nbytes) then returns the payloads that
+    completed, as memoryviews into the buffer, valid until the next get_buffer().
+    Unread bytes are moved to the front when a frame would run off the end, the
+    buffer grows to fit a frame larger than it, and it shrinks back once drained.
+    """
+
+    def __init__(self, buffer_size=SMALL_FRAME, max_frame=MAX_FRAME):
+        self.buffer_size = buffer_size
+        self.max_frame = max_frame
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # unread bytes are _buffer[_start:_end]
+        self._end = 0
+
+    def get_buffer(self):
+        start, end = self._start, self._end
+        if start == end:
+            start = end = self._start = self._end = 0
+            if len(self._buffer) > self.buffer_size:
+                self._buffer = bytearray(self.buffer_size)  # let go of the room a large frame needed
+                self._view = memoryview(self._buffer)
+        needed = HEADER.size
+        if end - start >= HEADER.size:
+            (length,) = HEADER.unpack_from(self._buffer, start)
+            needed += min(length, self.max_frame)
+        if start + needed > len(self._buffer):
+            unread = end - start
+            if needed > len(self._buffer):
+                buffer = bytearray(max(needed, 2 * len(self._buffer)))
+                buffer[:unread] = self._view[start:end]
+                self._buffer, self._view = buffer, memoryview(buffer)
+            else:
+                self._view[:unread] = self._view[start:end]
+            self._start, self._end = 0, unread
+        return self._view[self._end:]
+
+    def frames(self, nbytes):
+        """Record nbytes received into get_buffer()'s view; returns the payloads of the frames they complete."""
+        self._end += nbytes
+        buffer, view, end = self._buffer, self._view, self._end
+        position = self._start
+        frames = []
+        while end - position >= HEADER.size:
+            (length,) = HEADER.unpack_from(buffer, position)
+            if length > self.max_frame:
+                raise FrameTooLarge(f'peer announced a {length} byte frame, limit is {self.max_frame}')
+            stop = position + HEADER.size + length
+            if stop > end:
+                break
+            frames.append(view[position + HEADER.size:stop])
+            position = stop
+        self._start = position
+        return frames
@@ -0,0 +1,192 @@
+"""Client side of the framed protocol: kept-alive connections shared through a bounded pool."""
+import contextlib
+import socket
+import threading
+import time
+from collections import deque
+
+from framing import FrameReader, encode_frame, send_frame
+
+# Requests and request bytes in flight at once. Past what the socket buffers hold, the server blocks writing
+# replies nobody reads yet, stops reading, and sendall() never returns
+PIPELINE_WINDOW = 64
+PIPELINE_BYTES = 256 << 10
+
+_resolved = {}  # (host, port) -> (expires, (family, address))
+_resolved_lock = threading.Lock()
+
+
+def resolve(host, port, ttl=300):
+    """(family, address) to connect to, cached for ttl seconds so new connections skip DNS."""
+    now = time.monotonic()
+    with _resolved_lock:
+        entry = _resolved.get((host, port))
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    family, _, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+    with _resolved_lock:
+        _resolved[(host, port)] = (now + ttl, (family, address))
+    return family, address
+
+
+class Connection:
+    """One kept-alive connection. The server's greeting is read on connect; after that
+    every request frame gets exactly one reply frame, in order."""
+
+    def __init__(self, host, port, timeout=5):
+        family, address = resolve(host, port)
+        self.timeout = timeout
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # don't hold small requests back
+            self.sock.settimeout(timeout)
+            self.sock.connect(address)
+            self.reader = FrameReader(self.sock)
+            self.greeting = self._reply()
+        except BaseException:
+            self.sock.close()
+            raise
+        self.last_used = time.monotonic()
+
+    def _reply(self):
+        frame = self.reader.recv_frame()
+        if frame is None:
+            raise ConnectionError('server closed the connection')
+        return bytes(frame)  # the view is only valid until the next read
+
+    def request(self, payload):
+        send_frame(self.sock, payload)
+        return self._reply()
+
+    def pipeline(self, payloads):
+        """Send requests without waiting for each reply; returns the replies in order."""
+        replies = []
+        start = 0
+        while start < len(payloads):
+            # At least one request per window; one larger than PIPELINE_BYTES goes alone, as request() would send it
+            end = start + 1
+            size = len(payloads[start])
+            while end < len(payloads) and end - start < PIPELINE_WINDOW and size + len(payloads[end]) <= PIPELINE_BYTES:
+                size += len(payloads[end])
+                end += 1
+            if end - start == 1:
+                send_frame(self.sock, payloads[start])
+            else:
+                self.sock.sendall(b''.join(encode_frame(payload) for payload in payloads[start:end]))
+            replies.extend(self._reply() for _ in range(end - start))
+            start = end
+        return replies
+
+    def is_open(self):
+        """False if the server closed the connection (or sent something unasked) while it sat idle."""
+        try:
+            self.sock.setblocking(False)
+            self.sock.recv(1, socket.MSG_PEEK)
+            return False
+        except BlockingIOError:
+            return True  # nothing to read: still open and in step
+        except OSError:
+            return False
+        finally:
+            self.sock.settimeout(self.timeout)
+
+    def close(self):
+        self.sock.close()
+
+
+class ConnectionPool:
+    """Up to max_size kept-alive connections to one server, shared between threads.
+
+    connection() lends one out: an idle one if there is one (most recently used
+    first, so surplus connections age out), a new one while under max_size, or
+    else it waits up to timeout for one to come back. Idle connections past
+    idle_timeout, or that the server has closed, are dropped instead of reused;
+    keep idle_timeout below the server's --idle-timeout. A connection whose
+    exchange raised is closed, since where its stream stands is unknown.
+    """
+
+    def __init__(self, host, port, max_size=8, timeout=5, idle_timeout=30):
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._idle = deque()
+        self._size = 0  # connections open, idle or lent out
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextlib.contextmanager
+    def connection(self):
+        connection = self._acquire()
+        try:
+            yield connection
+        except BaseException:
+            self._discard(connection)
+            raise
+        self._release(connection)
+
+    def request(self, payload):
+        with self.connection() as connection:
+            return connection.request(payload)
+
+    def pipeline(self, payloads):
+        with self.connection() as connection:
+            return connection.pipeline(payloads)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._size -= 1
+            self._condition.notify_all()
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError('connection pool is closed')
+                while self._idle:
+                    connection = self._idle.pop()
+                    if time.monotonic() - connection.last_used < self.idle_timeout and connection.is_open():
+                        return connection
+                    connection.close()
+                    self._size -= 1
+                if self._size < self.max_size:
+                    self._size += 1  # reserve the slot, then connect outside the lock
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f'no connection to {self.host}:{self.port} free within {self.timeout}s')
+                self._condition.wait(remaining)
+        try:
+            return Connection(self.host, self.port, self.timeout)
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, connection):
+        connection.last_used = time.monotonic()
+        with self._condition:
+            if self._closed:
+                connection.close()
+                self._size -= 1
+            else:
+                self._idle.append(connection)
+            self._condition.notify()
+
+    def _discard(self, connection):
+        connection.close()
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
@@ -0,0 +1,91 @@
+"""Benchmark: tuples.py against the original input()-based script, time and peak memory per run.
+
+one case     a single case of --size integers, the original script's only input
+many cases   --cases cases of 100 integers in one run; the original needs a
+             process per case, so its figure is extrapolated from timing 20 runs
+
+Both scripts run as subprocesses on the same generated input and their outputs
+are compared. Run from the repository root: python bench_tuples.py [--size 5000000]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ORIGINAL = """n = int(input())
+integer_list = tuple(map(int, input().split()))
+print(hash(integer_list))
+"""
+
+
+# Runs the script, then reports its own peak RSS: ru_maxrss from wait4() would include the
+# high-water mark the child inherits from this process when it is forked
+MEASURED = """import runpy, sys
+script = sys.argv[1]
+sys.argv = sys.argv[1:]
+runpy.run_path(script, run_name='__main__')
+sys.stdout.flush()
+with open('/proc/self/status') as status:
+    print(status.read().split('VmHWM:')[1].split()[0], file=sys.stderr)
+"""
+
+
+def run(script, path):
+    """(output, seconds, peak RSS in MiB) of one run of script with path on stdin."""
+    with open(path, 'rb') as stdin:
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-c', MEASURED, script], stdin=stdin, capture_output=True,
+                                 check=True)
+        elapsed = time.perf_counter() - start
+    return process.stdout, elapsed, int(process.stderr) / 1024
+
+
+def write_cases(path, cases):
+    with open(path, 'w') as f:
+        for case in cases:
+            f.write(f"{len(case)}\n{' '.join(map(str, case))}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--size', type=int, default=5_000_000, help='integers in the single case')
+    parser.add_argument('--cases', type=int, default=100_000, help='cases in the many-cases run')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tuples.py')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        original = os.path.join(tmp, 'original.py')
+        with open(original, 'w') as f:
+            f.write(ORIGINAL)
+
+        one = os.path.join(tmp, 'one.txt')
+        write_cases(one, [[rng.randrange(-10 ** 9, 10 ** 9) for _ in range(args.size)]])
+        print(f"one case of {args.size} integers ({os.path.getsize(one) / 2 ** 20:.0f} MiB of input)")
+        outputs = []
+        for name, path in (('original', original), ('tuples.py', script)):
+            output, elapsed, rss = run(path, one)
+            outputs.append(output)
+            print(f"  {name:<10} {elapsed:>7.2f}s {args.size / elapsed / 1e6:>7.2f}M ints/s {rss:>8.0f} MiB peak RSS")
+        print(f"  hashes {'match' if outputs[0] == outputs[1] else 'DIFFER'}")
+
+        cases = [[rng.randrange(-10 ** 9, 10 ** 9) for _ in range(100)] for _ in range(args.cases)]
+        many = os.path.join(tmp, 'many.txt')
+        write_cases(many, cases)
+        print(f"{args.cases} cases of 100 integers")
+        single = os.path.join(tmp, 'single.txt')
+        write_cases(single, cases[:1])
+        elapsed = sum(run(original, single)[1] for _ in range(20)) / 20
+        print(f"  {'original':<10} {elapsed * args.cases:>7.2f}s {1 / elapsed:>7.0f} cases/s (one process per case)")
+        output, elapsed, rss = run(script, many)
+        print(f"  {'tuples.py':<10} {elapsed:>7.2f}s {args.cases / elapsed:>7.0f} cases/s {rss:>8.0f} MiB peak RSS")
+        expected = ''.join(f'{hash(tuple(case))}\n' for case in cases).encode()
+        print(f"  hashes {'match' if output == expected else 'DIFFER'}")
+
+
+if __name__ == '__main__':
+    main()
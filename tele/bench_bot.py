@@ -0,0 +1,236 @@
+"""Benchmark: drive LankaLegendsBot's handlers directly with thousands of simulated players.
+
+Each player joins, invites friends and plays whatever games it is dealt (every
+game type comes up), winning with probability --skill; players run concurrently
+and each one's updates go in order, as PerUserUpdateProcessor would run them.
+Nothing touches the network: Updates are built locally and replies go to a
+counting fake sender. Reports throughput, p50/p99 latency per handler and for
+start_game/process_game_result, SQLite statements per update and memory growth.
+
+--save writes the results as JSON; --baseline compares against such a file and
+exits with status 1 if throughput, p99 latency or statements per update regress
+by more than --tolerance.
+
+Run from the tele directory: python bench_bot.py [--players 2000] [--save FILE] [--baseline FILE]
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from telegram import Update
+
+from loadtest import message_update
+from outbox import Outbox
+from storage import PlayerStore
+from test_bot import LankaLegendsBot
+
+HANDLERS = ('start', 'handle_invite', 'handle_game_response', 'profile', 'leaderboard', 'force_game')
+TIMED = HANDLERS + ('start_game', 'process_game_result')
+
+
+class Recorder:
+    """Wraps the bot's handlers and game internals on the instance to time every call."""
+
+    def __init__(self, bot):
+        self.samples = {name: [] for name in TIMED}
+        for name in TIMED:
+            setattr(bot, name, self._timed(getattr(bot, name), self.samples[name]))
+
+    @staticmethod
+    def _timed(fn, samples):
+        async def call(*args):
+            start = time.perf_counter()
+            try:
+                return await fn(*args)
+            finally:
+                samples.append(time.perf_counter() - start)
+        return call
+
+    @property
+    def updates(self):
+        return sum(len(self.samples[name]) for name in HANDLERS)
+
+    def latency_ms(self):
+        stats = {}
+        for name, samples in self.samples.items():
+            if samples:
+                samples.sort()
+                stats[name] = {'count': len(samples), 'p50': samples[len(samples) // 2] * 1000,
+                               'p99': samples[int(len(samples) * 0.99)] * 1000}
+        return stats
+
+
+class StatementCounter:
+    """sqlite3 trace callback counting statements by their first keyword."""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()  # called from the store's worker threads
+
+    def __call__(self, sql):
+        keyword = sql.lstrip().split(None, 1)[0].upper()
+        with self._lock:
+            self.counts[keyword] += 1
+
+
+def answers(session, win):
+    """Messages a player sends to answer session, winning it if win."""
+    if session.kind == 'dice_duel':
+        return ['/roll']  # the die decides
+    if session.kind == 'tap_fast':
+        return ['tap'] * session.target  # losing would mean waiting out the deadline
+    if session.kind == 'lucky_box':
+        return [str(session.winning_box if win else session.winning_box + 1)]
+    return [session.answer if win else 'wrong']
+
+
+async def play(bot, user_id, rng, steps, skill, update_ids, friend_ids):
+    context = SimpleNamespace(args=[], bot=None, user_data={}, error=None)
+
+    async def send(handler, **fields):
+        await handler(Update.de_json(message_update(next(update_ids), user_id, **fields), None), context)
+
+    def friends(count):
+        return [{'id': next(friend_ids), 'is_bot': False, 'first_name': 'friend'} for _ in range(count)]
+
+    await send(bot.start, text='/start')
+    await send(bot.handle_invite, new_chat_members=friends(2))
+    for _ in range(steps):
+        roll = rng.random()
+        if roll < 0.03:
+            await send(bot.profile, text='/profile')
+        elif roll < 0.05:
+            await send(bot.leaderboard, text='/leaderboard')
+        elif roll < 0.15:
+            await send(bot.handle_invite, new_chat_members=friends(1))
+        elif (session := bot.sessions.get(user_id)) is None:
+            player = await bot.store.get_player(user_id)
+            if player.level > 3:
+                return  # finished the game
+            await send(bot.force_game, text='/forcegame')  # out of lives: deal a game at the current level
+        else:
+            for text in answers(session, rng.random() < skill):
+                await send(bot.handle_game_response, text=text)
+
+
+async def run(args, path):
+    random.seed(args.seed)  # the games' own dice
+    sent = itertools.count()
+
+    async def deliver(chat_id, text, parse_mode=None):
+        next(sent)
+
+    store = PlayerStore(path, durability=args.durability)
+    statements = StatementCounter()
+    bot = LankaLegendsBot(Outbox(deliver, global_rate=1e9, chat_rate=1e9, chat_burst=1e9), store)
+    recorder = Recorder(bot)
+    await bot.open()
+    store.set_trace_callback(statements)
+    if args.tracemalloc:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    update_ids = itertools.count(1)
+    friend_ids = itertools.count(10 ** 9)
+    start = time.perf_counter()
+    await asyncio.gather(*(play(bot, user_id, random.Random(args.seed * 1_000_003 + user_id), args.steps, args.skill,
+                                update_ids, friend_ids)
+                           for user_id in range(1, args.players + 1)))
+    elapsed = time.perf_counter() - start
+
+    memory = {'max_rss_growth_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+              'cached_players': len(store.cache), 'open_sessions': len(bot.sessions)}
+    if args.tracemalloc:
+        after = tracemalloc.take_snapshot()
+        memory['traced_peak_kib'] = tracemalloc.get_traced_memory()[1] // 1024
+        memory['top_growth'] = [str(stat) for stat in after.compare_to(before, 'lineno')[:5]]
+        tracemalloc.stop()
+    await bot.close()
+
+    updates = recorder.updates
+    return {
+        'players': args.players,
+        'updates': updates,
+        'seconds': elapsed,
+        'updates_per_sec': updates / elapsed,
+        'latency_ms': recorder.latency_ms(),
+        'statements': dict(statements.counts),
+        'statements_per_update': sum(statements.counts.values()) / updates,
+        'messages_sent': next(sent),
+        'memory': memory,
+    }
+
+
+def report(result):
+    print(f"{result['players']} players, {result['updates']} updates in {result['seconds']:.2f}s: "
+          f"{result['updates_per_sec']:.0f} updates/s, {result['messages_sent']} messages sent")
+    print(f"\n{'':<22}{'calls':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, stats in result['latency_ms'].items():
+        print(f"{name:<22}{stats['count']:>8}{stats['p50']:>10.2f}{stats['p99']:>10.2f}")
+    kinds = ', '.join(f'{kind} {count}' for kind, count in sorted(result['statements'].items()))
+    print(f"\nSQL statements: {result['statements_per_update']:.2f} per update ({kinds})")
+    memory = result['memory']
+    print(f"Memory: max RSS +{memory['max_rss_growth_kib']} KiB, {memory['cached_players']} cached players, "
+          f"{memory['open_sessions']} open sessions")
+    if 'traced_peak_kib' in memory:
+        print(f"Traced peak {memory['traced_peak_kib']} KiB; largest growth:")
+        for line in memory['top_growth']:
+            print(f"  {line}")
+
+
+def regressions(result, baseline, tolerance):
+    problems = []
+    if result['updates_per_sec'] < baseline['updates_per_sec'] * (1 - tolerance):
+        problems.append(f"throughput {result['updates_per_sec']:.0f} < {baseline['updates_per_sec']:.0f} updates/s")
+    for name, stats in result['latency_ms'].items():
+        base = baseline['latency_ms'].get(name)
+        if base and stats['p99'] > base['p99'] * (1 + tolerance):
+            problems.append(f"{name} p99 {stats['p99']:.2f} > {base['p99']:.2f} ms")
+    if result['statements_per_update'] > baseline['statements_per_update'] * (1 + tolerance):
+        problems.append(f"{result['statements_per_update']:.2f} > {baseline['statements_per_update']:.2f} "
+                        f"statements per update")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--players', type=int, default=2000)
+    parser.add_argument('--steps', type=int, default=30, help='actions per player after joining')
+    parser.add_argument('--skill', type=float, default=0.7, help='chance a player answers a game correctly')
+    parser.add_argument('--durability', default='normal', choices=('full', 'normal', 'lazy'))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tracemalloc', action='store_true', help='trace allocations (slows the run down)')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved earlier with --save')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression against the baseline')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(run(args, os.path.join(tmp, 'bench.db')))
+    report(result)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = regressions(result, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
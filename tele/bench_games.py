@@ -0,0 +1,137 @@
+"""Micro-benchmark: cost of dealing and answering one game, before and after GameEngine, and how
+often players are dealt a question again before the pool runs out.
+
+Run from the tele directory: python bench_games.py [rounds]
+"""
+import random
+import sys
+import time
+
+from content import CONTENT_PATH, load_content
+from games import GameEngine
+
+PLAYERS = 1000
+
+# GAMES as it was before the engine, when every game was a fixed entry
+LEGACY_GAMES = {
+    'trivia': {
+        'easy': [('What’s the capital of Sri Lanka?', 'Colombo'), ('Which animal is on the SL flag?', 'Lion')],
+        'medium': [('What’s the highest peak in SL?', 'Pidurutalagala'), ('What’s the longest river?', 'Mahaweli')],
+        'hard': [('Who was SL’s first Prime Minister?', 'D.S. Senanayake'),
+                 ('What year did SL gain independence?', '1948')]
+    },
+    'dice_duel': {'easy': 4, 'medium': 6, 'hard': 8},
+    'tap_fast': {'easy': 5, 'medium': 10, 'hard': 15},
+    'math_battle': {'easy': ('2 + 3', '5'), 'medium': ('15 * 3', '45'), 'hard': ('7 * 13', '91')},
+    'lucky_box': {'easy': 3, 'medium': 5, 'hard': 7},
+    'emoji_memory': {
+        'easy': ('😀😺😀', '😀😺😀'),
+        'medium': ('😺🐘😀😺🐘', '😺🐘😀😺🐘'),
+        'hard': ('🐘😺😀🐘😺😀', '🐘😺😀🐘😺😀')
+    }
+}
+
+# The dispatch start_game/handle_game_response used before the engine, minus the Telegram I/O
+def legacy_start(games, level, current_game):
+    difficulty = {1: 'easy', 2: 'medium', 3: 'hard'}[level]
+    game_type = random.choice(list(games.keys()))
+    if game_type == 'trivia':
+        question, answer = random.choice(games['trivia'][difficulty])
+        prompt = f"<b>🧠 Trivia Time!</b> {question}\nReply with your answer!"
+        game = {'type': 'trivia', 'answer': answer, 'level': level, 'game_num': current_game}
+    elif game_type == 'dice_duel':
+        target = games['dice_duel'][difficulty]
+        prompt = f"<b>🎲 Dice Duel!</b> Roll a number higher than {target} using /roll!\nReply with /roll"
+        game = {'type': 'dice_duel', 'target': target, 'level': level, 'game_num': current_game}
+    elif game_type == 'tap_fast':
+        target = games['tap_fast'][difficulty]
+        prompt = f"<b>👆 Tap Fast!</b> Send 'tap' {target} times in 5 seconds!\nStart now!"
+        game = {'type': 'tap_fast', 'target': target, 'level': level, 'game_num': current_game,
+                'start_time': time.time(), 'taps': 0}
+    elif game_type == 'math_battle':
+        expression, answer = games['math_battle'][difficulty]
+        prompt = f"<b>🧮 Math Battle!</b> Solve: {expression}\nReply with the answer!"
+        game = {'type': 'math_battle', 'answer': answer, 'level': level, 'game_num': current_game}
+    elif game_type == 'lucky_box':
+        num_boxes = games['lucky_box'][difficulty]
+        winning_box = random.randint(1, num_boxes)
+        prompt = f"<b>🎁 Pick a Lucky Box!</b> Choose a number from 1 to {num_boxes}\nReply with a number!"
+        game = {'type': 'lucky_box', 'winning_box': winning_box, 'level': level, 'game_num': current_game}
+    else:
+        sequence, answer = games['emoji_memory'][difficulty]
+        prompt = f"<b>🧠 Emoji Memory!</b> Memorize this: {sequence}\nReply with the exact sequence!"
+        game = {'type': 'emoji_memory', 'answer': answer, 'level': level, 'game_num': current_game}
+    return prompt, game
+
+
+def legacy_answer(game, text):
+    if game['type'] == 'trivia':
+        return text.lower() == game['answer'].lower()
+    elif game['type'] == 'dice_duel':
+        return random.randint(1, 6) >= game['target'] if text == '/roll' else None
+    elif game['type'] == 'tap_fast':
+        if text.lower() == 'tap' and time.time() - game['start_time'] <= 5:
+            game['taps'] += 1
+            return True if game['taps'] >= game['target'] else None
+        return False
+    elif game['type'] == 'math_battle':
+        return text == game['answer']
+    elif game['type'] == 'lucky_box':
+        try:
+            return int(text) == game['winning_box']
+        except ValueError:
+            return None
+    elif game['type'] == 'emoji_memory':
+        return text == game['answer']
+
+
+def bench(name, rounds, play):
+    random.seed(0)
+    start = time.perf_counter()
+    for i in range(rounds):
+        play(i % 3 + 1, i)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {elapsed / rounds * 1e9:8.0f} ns per start+answer ({rounds} rounds)")
+    return elapsed
+
+
+def early_repeats(deal, pool_size, players=100, rounds=30):
+    """Share of trivia questions a player is dealt again before having seen the whole pool."""
+    repeats = 0
+    for player in range(players):
+        seen = set()
+        for _ in range(rounds):
+            question = deal(player)
+            if question in seen:
+                repeats += 1
+            seen.add(question)
+            if len(seen) == pool_size:
+                seen.clear()
+    return repeats / (players * rounds)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    engine = GameEngine(load_content(CONTENT_PATH))
+
+    def legacy(level, i):
+        _, game = legacy_start(LEGACY_GAMES, level, 0)
+        legacy_answer(game, 'tap')
+
+    def current(level, i):
+        player = i % PLAYERS  # players come back, so their cursors already exist
+        _, session = engine.start(player, player, level, 0)
+        engine.answer(session, 'tap')
+
+    before = bench('before', rounds, legacy)
+    after = bench('after', rounds, current)
+    print(f"speedup: {before / after:.2f}x")
+
+    pool_size = len(engine.games['trivia'].pools[1])
+    print(f"early repeats of {pool_size} easy trivia questions: "
+          f"random.choice {early_repeats(lambda player: random.randrange(pool_size), pool_size):.0%}, "
+          f"dealer {early_repeats(lambda player: engine.dealer.deal(player, 'bench', pool_size), pool_size):.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark: lookup and insert cost on a large database, before and after the schema migrations.
+
+Builds a database at schema v1 (the schema before migrations existed), times the
+store's statements, migrates it to the current version and times them again.
+Defaults to 1M players and 10M invites, which needs a few GB of disk and minutes;
+pass smaller sizes for a quick run.
+
+Run from the tele directory: python bench_storage.py [--players N] [--invites N] [--path FILE]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from migrations import MIGRATIONS, check_query_plans, migrate, schema_version
+from storage import HOT_QUERIES, SELECT_PLAYER, SELECT_TOP, _insert_invites
+
+# SELECT_TOP as it reads a v1 database, which predates players.minutes_taken (v4)
+SELECT_TOP_V1 = SELECT_TOP.replace('minutes_taken', 'start_time')
+INVITERS_OF = 'SELECT inviter_id FROM invites WHERE invitee_id = ?'
+INVITE_EXISTS = 'SELECT 1 FROM invites WHERE inviter_id = ? AND invitee_id = ?'
+
+
+def populate(conn, players, invites, seed=1):
+    rng = random.Random(seed)
+    with conn:
+        conn.executemany('INSERT INTO players (user_id, username, start_time, failures, score) VALUES (?, ?, ?, ?, ?)',
+                         ((user_id, f'user{user_id}', 1.7e9, rng.randrange(5),
+                           rng.randrange(1, 1000) if rng.random() < 0.05 else 0)
+                          for user_id in range(1, players + 1)))
+    chunk = 1_000_000
+    for start in range(0, invites, chunk):
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO invites (inviter_id, invitee_id, timestamp) VALUES (?, ?, ?)',
+                             ((rng.randrange(1, players + 1), rng.randrange(1, 50 * players), 1.7e9)
+                              for _ in range(min(chunk, invites - start))))
+
+
+def timed(conn, sql, params, budget=2.0):
+    """Microseconds per execution of sql over params, stopping early after budget seconds."""
+    done = 0
+    start = time.perf_counter()
+    for args in params:
+        conn.execute(sql, args).fetchall()
+        done += 1
+        if done % 16 == 0 and time.perf_counter() - start > budget:
+            break
+    return (time.perf_counter() - start) / done * 1e6
+
+
+def timed_invites(conn, players, events, batch=500, seed=2):
+    """Microseconds per join event (3 invitees) through _insert_invites, committed in batches as the store does."""
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for first in range(0, events, batch):
+        with conn:
+            for _ in range(min(batch, events - first)):
+                _insert_invites(conn, rng.randrange(1, players + 1), [rng.randrange(1, 50 * players) for _ in range(3)],
+                                1.7e9)
+    return (time.perf_counter() - start) / events * 1e6
+
+
+def measure(conn, players, label, select_top=SELECT_TOP):
+    rng = random.Random(3)
+    queries = [(select_top, params) if sql == SELECT_TOP else (sql, params) for sql, params in HOT_QUERIES]
+    pages = conn.execute('PRAGMA page_count').fetchone()[0] - conn.execute('PRAGMA freelist_count').fetchone()[0]
+    size = pages * conn.execute('PRAGMA page_size').fetchone()[0]
+    print(f"\n{label}: schema v{schema_version(conn)}, {size / 2 ** 20:.0f} MiB in use")
+    for problem in check_query_plans(conn, queries):
+        print(f"  plan: {problem}")
+    rows = [
+        ('player by id', timed(conn, SELECT_PLAYER, ((rng.randrange(1, players + 1),) for _ in range(50_000)))),
+        ('leaderboard page 1', timed(conn, select_top, ((5, 0) for _ in range(5_000)))),
+        ('leaderboard page 20', timed(conn, select_top, ((5, 95) for _ in range(5_000)))),
+        ('invite exists', timed(conn, INVITE_EXISTS, ((rng.randrange(1, players + 1), rng.randrange(1, 50 * players))
+                                                       for _ in range(50_000)))),
+        ('inviters of a user', timed(conn, INVITERS_OF, ((rng.randrange(1, 50 * players),) for _ in range(50_000)))),
+        ('record join event', timed_invites(conn, players, 20_000)),
+    ]
+    for name, micros in rows:
+        print(f"  {name:<20} {micros:12.1f} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--players', type=int, default=1_000_000)
+    parser.add_argument('--invites', type=int, default=10_000_000)
+    parser.add_argument('--path', help='database file to build (default: a temporary file)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path or os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA cache_size = -16384')
+        migrate(conn, target=1)
+        start = time.perf_counter()
+        populate(conn, args.players, args.invites)
+        print(f"Built {args.players} players / {args.invites} invites in {time.perf_counter() - start:.1f}s")
+        measure(conn, args.players, 'before', SELECT_TOP_V1)
+
+        start = time.perf_counter()
+        migrate(conn)
+        print(f"\nMigrated v1 -> v{len(MIGRATIONS)} in {time.perf_counter() - start:.1f}s")
+        measure(conn, args.players, 'after')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+
+class Player:
+    __slots__ = ('user_id', 'username', 'level', 'lives', 'current_game', 'invites', 'start_time', 'failures',
+                 'score', 'minutes_taken')
+
+    def __init__(self, user_id, username=None, level=0, lives=2, current_game=0, invites=0, start_time=None,
+                 failures=0, score=0, minutes_taken=None):
+        self.user_id = user_id
+        self.username = username
+        self.level = level
+        self.lives = lives
+        self.current_game = current_game
+        self.invites = invites
+        self.start_time = start_time
+        self.failures = failures
+        self.score = score
+        self.minutes_taken = minutes_taken
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'Player({fields})'
+
+
+class PlayerCache:
+    """Bounded LRU cache of Player records keyed by user_id."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._players = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._players)
+
+    def get(self, user_id):
+        player = self._players.get(user_id)
+        if player is None:
+            self.misses += 1
+            return None
+        self._players.move_to_end(user_id)
+        self.hits += 1
+        return player
+
+    def peek(self, user_id):
+        """Return a cached player without touching LRU order or counters."""
+        return self._players.get(user_id)
+
+    def put(self, player):
+        self._players[player.user_id] = player
+        self._players.move_to_end(player.user_id)
+        if len(self._players) > self.maxsize:
+            self._players.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, user_id):
+        self._players.pop(user_id, None)
+
+    def stats(self):
+        return {'size': len(self._players), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
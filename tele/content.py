@@ -0,0 +1,133 @@
+"""Game content from a JSON file, hot-reloaded into a new GameEngine when the file changes.
+
+The file maps game kinds to their settings in the shape of games.GAMES; kinds
+it leaves out keep the built-in settings. Parsing the file and building the
+engine, which pre-renders every prompt, happen in a worker thread, and the
+finished engine is handed over in one assignment: handlers never wait on a
+reload and never see half-loaded content. Sessions already dealt carry their
+own answers, so they finish normally across a reload.
+"""
+import asyncio
+import json
+import logging
+import os
+import reprlib
+
+from games import DIFFICULTIES, GAMES, GAME_TYPES, GameEngine
+
+CONTENT_PATH = 'content.json'
+
+logger = logging.getLogger('lanka_legends.content')
+
+
+def _int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _strings(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _generated(settings, **fields):
+    return (isinstance(settings, dict) and all(check(settings.get(name)) for name, check in fields.items())
+            and ('pool' not in settings or _int(settings['pool'])))
+
+
+# What one difficulty's settings must look like for each kind; games.GAMES has examples
+_LEVEL_CHECKS = {
+    'trivia': lambda questions: isinstance(questions, list) and all(
+        _strings(question) and len(question) == 2 for question in questions),
+    'dice_duel': _int,
+    'tap_fast': _int,
+    'math_battle': lambda settings: _generated(settings, terms=_int, max=_int,
+                                               operators=lambda operators: isinstance(operators, str)),
+    'lucky_box': _int,
+    'emoji_memory': lambda settings: _generated(settings, length=_int, emojis=_strings),
+}
+
+
+def check_content(content):
+    """Raises ValueError unless content holds only known game kinds, each with well-typed settings per difficulty."""
+    if not isinstance(content, dict):
+        raise ValueError('content should be an object of game kinds')
+    for kind, levels in content.items():
+        if kind not in GAME_TYPES:
+            raise ValueError(f'unknown game kind {kind!r}')
+        if not isinstance(levels, dict):
+            raise ValueError(f'{kind} should be an object of difficulties')
+        for difficulty in DIFFICULTIES.values():
+            if difficulty not in levels:
+                raise ValueError(f'{kind} has no {difficulty} settings')
+            if not _LEVEL_CHECKS[kind](levels[difficulty]):
+                raise ValueError(f'bad {difficulty} {kind} settings: {reprlib.repr(levels[difficulty])}')
+
+
+def load_content(path):
+    """Built-in GAMES overlaid with the kinds defined in the file at path."""
+    with open(path, encoding='utf-8') as f:
+        content = json.load(f)
+    try:
+        check_content(content)
+    except ValueError as e:
+        raise ValueError(f'{path}: {e}') from None
+    return {**GAMES, **content}
+
+
+class ContentFile:
+    """Watches a content file and installs a GameEngine built from it whenever it changes.
+
+    install is called on the event loop with each new engine. Engines share
+    dealer, so players keep their place in pools that didn't change size. A file
+    that fails to load is logged and the content in use is kept.
+    """
+
+    def __init__(self, path, dealer, install, interval=5):
+        self.path = path
+        self.dealer = dealer
+        self.install = install
+        self.interval = interval
+        self._stamp = None
+        self._watch = None
+
+    def _changed(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        return stamp if stamp != self._stamp else None
+
+    def _build(self):
+        return GameEngine(load_content(self.path), self.dealer)
+
+    async def reload(self):
+        """Install the file's content if it changed since the last load; returns whether it did."""
+        stamp = self._changed()
+        if stamp is None:
+            return False
+        self._stamp = stamp  # a broken file is reported once, not on every poll
+        try:
+            engine = await asyncio.to_thread(self._build)
+        except Exception as e:  # anything a bad file can raise must leave the watcher running
+            logger.error("Keeping current game content: %s failed to load: %r", self.path, e)
+            return False
+        self.install(engine)
+        logger.info("Loaded game content from %s", self.path)
+        return True
+
+    async def start(self):
+        if not await self.reload() and self._stamp is None:
+            logger.warning("No game content at %s; using the built-in games", self.path)
+        self._watch = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reload()
+            except Exception:
+                logger.exception("Reloading game content from %s failed", self.path)
+
+    async def close(self):
+        if self._watch is not None:
+            self._watch.cancel()
@@ -0,0 +1,361 @@
+import functools
+import itertools
+import math
+import random
+import time
+from collections import OrderedDict
+
+from sessions import (DiceDuelSession, EmojiMemorySession, LuckyBoxSession, MathBattleSession, TapFastSession,
+                      TriviaSession)
+
+# Built-in game definitions; content.json, when present, replaces them kind by kind (see content.py)
+GAMES = {
+    'trivia': {
+        'easy': [('What’s the capital of Sri Lanka?', 'Colombo'), ('Which animal is on the SL flag?', 'Lion')],
+        'medium': [('What’s the highest peak in SL?', 'Pidurutalagala'), ('What’s the longest river?', 'Mahaweli')],
+        'hard': [('Who was SL’s first Prime Minister?', 'D.S. Senanayake'),
+                 ('What year did SL gain independence?', '1948')]
+    },
+    'dice_duel': {'easy': 4, 'medium': 6, 'hard': 8},  # Target number to beat
+    'tap_fast': {'easy': 5, 'medium': 10, 'hard': 15},  # Taps needed in 5 seconds
+    'math_battle': {  # Generated at load: terms numbers from 1 to max joined by operators
+        'easy': {'terms': 2, 'operators': '+', 'max': 10},
+        'medium': {'terms': 2, 'operators': '+-*', 'max': 20},
+        'hard': {'terms': 3, 'operators': '+-*', 'max': 15}
+    },
+    'lucky_box': {'easy': 3, 'medium': 5, 'hard': 7},  # Number of boxes
+    'emoji_memory': {  # Generated at load: length emojis drawn from emojis
+        'easy': {'length': 3, 'emojis': ['😀', '😺', '🐘']},
+        'medium': {'length': 5, 'emojis': ['😀', '😺', '🐘', '🦁', '🌴']},
+        'hard': {'length': 7, 'emojis': ['😀', '😺', '🐘', '🦁', '🌴', '🥥', '🐢']}
+    }
+}
+
+DIFFICULTIES = {1: 'easy', 2: 'medium', 3: 'hard'}
+
+SMALL_POOL = 256  # pools up to this size are dealt in a permutation per player, kept as bytes
+GENERATED_POOL = 200  # puzzles generated per level of math_battle and emoji_memory, unless settings give 'pool'
+
+GAME_TYPES = {}
+
+
+class Dealer:
+    """Deals each player the items of a pool in a shuffled order, with no repeats until they've had them all.
+
+    For pools of up to SMALL_POOL items, which is all of them so far, each
+    player gets a random permutation, picked from a table shared per size (all
+    permutations when there are few, else 256 random ones) and started at a
+    random offset, so a reshuffle costs two random draws. Larger pools are
+    shuffled once into a shared order; a player steps through it with a random
+    stride coprime to the size from a random offset, so their cursor stays a
+    few ints however large the pool. Dealing is O(1) either way. A new order is
+    drawn once the player has been through the pool, or when its size changed
+    on a content reload. Cursors are kept for the maxsize most recently shuffled
+    (player, pool) pairs; a forgotten one just starts a fresh order.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._cursors = OrderedDict()  # (user_id, pool) -> [size, order, stride, offset, position]
+        self._orders = {}  # (pool, size) -> shared shuffled order for large pools
+
+    def deal(self, user_id, pool, size):
+        """Index of the next item of pool, a sequence of size items, for this player."""
+        key = (user_id, pool)
+        cursor = self._cursors.get(key)
+        if cursor is None or cursor[0] != size or cursor[4] == size:
+            cursor = self._shuffle(pool, size, cursor)
+            self._cursors[key] = cursor
+            # Recency is only refreshed here, once a round, instead of on every deal
+            self._cursors.move_to_end(key)
+            if len(self._cursors) > self.maxsize:
+                self._cursors.popitem(last=False)
+        size, order, stride, offset, position = cursor
+        cursor[4] = position + 1
+        return order[(stride * position + offset) % size]
+
+    def _shuffle(self, pool, size, previous):
+        last = None
+        if previous is not None and previous[0] == size > 1:
+            _, order, stride, offset, _ = previous
+            last = order[(stride * (size - 1) + offset) % size]
+        if size <= SMALL_POOL:
+            order = random.choice(_permutations(size))
+            offset = int(random.random() * size)
+            if order[offset] == last:
+                offset = (offset + 1) % size  # don't open a new round with the item that closed the last one
+            return [size, order, 1, offset, 0]
+        order = self._orders.get((pool, size))
+        if order is None:
+            order = self._orders[(pool, size)] = tuple(random.sample(range(size), size))
+        stride = random.choice(_coprimes(size))
+        offset = int(random.random() * size)
+        if order[offset] == last:
+            offset = (offset + 1) % size
+        return [size, order, stride, offset, 0]
+
+
+@functools.lru_cache(maxsize=64)
+def _permutations(size):
+    """Orders of range(size) to deal small pools in, as bytes."""
+    if math.factorial(size) <= 1024:
+        return tuple(bytes(order) for order in itertools.permutations(range(size)))
+    return tuple(bytes(random.sample(range(size), size)) for _ in range(256))
+
+
+@functools.lru_cache(maxsize=64)
+def _coprimes(size):
+    """Strides that visit every position of a pool of size items."""
+    return tuple(a for a in range(1, size) if math.gcd(a, size) == 1) or (1,)
+
+
+def register(cls):
+    """Class decorator adding a game to the engine's registry."""
+    GAME_TYPES[cls.kind] = cls
+    return cls
+
+
+class Game:
+    """A game type. Prompts and answers are prepared once per level in __init__.
+
+    start() returns (prompt, session); answer() returns (reply, won) where reply
+    may be None and won is None while the game is still in progress. Timed games
+    set session.deadline in arm(), once the prompt has reached the player, and
+    resolve through expire() when it passes.
+    """
+    kind = None
+    timed = False
+
+    def __init__(self, config, dealer):
+        self.config = config
+        self.dealer = dealer
+        self.levels = {level: config[difficulty] for level, difficulty in DIFFICULTIES.items()}
+
+    def start(self, user_id, chat_id, level, game_num):
+        raise NotImplementedError
+
+    def answer(self, session, text):
+        raise NotImplementedError
+
+    def arm(self, session):
+        raise NotImplementedError
+
+    def expire(self, session):
+        raise NotImplementedError
+
+
+class PooledGame(Game):
+    """A game dealing (prompt, answer) pairs from a pool per level, built once in __init__ by items()."""
+    session_type = None  # session class, constructed with the answer
+
+    def __init__(self, config, dealer):
+        super().__init__(config, dealer)
+        self.pools = {}
+        for level, settings in self.levels.items():
+            self.pools[level] = tuple(self.items(settings))
+            if not self.pools[level]:
+                raise ValueError(f'no {DIFFICULTIES[level]} {self.kind} content')
+
+    def items(self, settings):
+        raise NotImplementedError
+
+    def start(self, user_id, chat_id, level, game_num):
+        pool = self.pools[level]
+        prompt, answer = pool[self.dealer.deal(user_id, (self.kind, level), len(pool))]
+        return prompt, self.session_type(user_id, chat_id, level, game_num, answer)
+
+
+def generated(generate, settings):
+    """Up to settings['pool'] distinct puzzles from generate(settings), as (puzzle, answer) pairs."""
+    wanted = settings.get('pool', GENERATED_POOL)
+    puzzles = {}
+    for _ in range(10 * wanted):  # small settings may allow fewer than wanted
+        puzzle, answer = generate(settings)
+        puzzles.setdefault(puzzle, answer)
+        if len(puzzles) == wanted:
+            break
+    return puzzles.items()
+
+
+@register
+class Trivia(PooledGame):
+    kind = 'trivia'
+    session_type = TriviaSession
+
+    def items(self, questions):
+        return [(f"<b>🧠 Trivia Time!</b> {question}\nReply with your answer!", answer.lower())
+                for question, answer in questions]
+
+    def answer(self, session, text):
+        return None, text.lower() == session.answer
+
+
+@register
+class DiceDuel(Game):
+    kind = 'dice_duel'
+
+    def __init__(self, config, dealer):
+        super().__init__(config, dealer)
+        self.prompts = {
+            level: f"<b>🎲 Dice Duel!</b> Roll a number higher than {target} using /roll!\nReply with /roll"
+            for level, target in self.levels.items()
+        }
+
+    def start(self, user_id, chat_id, level, game_num):
+        return self.prompts[level], DiceDuelSession(user_id, chat_id, level, game_num, self.levels[level])
+
+    def answer(self, session, text):
+        if not text.startswith('/roll'):
+            return None, None
+        roll = random.randint(1, 6)
+        won = roll >= session.target
+        return f"You rolled a {roll}! {'<b>Win!</b>' if won else '<b>Lose!</b>'}", won
+
+
+@register
+class TapFast(Game):
+    kind = 'tap_fast'
+    timed = True
+    window = 5
+
+    def __init__(self, config, dealer):
+        super().__init__(config, dealer)
+        self.prompts = {
+            level: f"<b>👆 Tap Fast!</b> Send 'tap' {target} times in {self.window} seconds!\nStart now!"
+            for level, target in self.levels.items()
+        }
+
+    def start(self, user_id, chat_id, level, game_num):
+        # The window opens in arm(), when the prompt is delivered; it may wait behind flood limits until then
+        session = TapFastSession(user_id, chat_id, level, game_num, self.levels[level], math.inf, 0)
+        return self.prompts[level], session
+
+    def arm(self, session):
+        session.deadline = time.monotonic() + self.window
+
+    def answer(self, session, text):
+        if time.monotonic() > session.deadline:
+            # The message beat the deadline timer through the event loop
+            return self.expire(session)
+        if text.lower() != 'tap':
+            return None, None
+        session.taps += 1
+        if session.taps >= session.target:
+            return "<b>Win!</b> You tapped fast enough! 😎", True
+        return None, None
+
+    def expire(self, session):
+        return f"<b>Lose!</b> Time’s up! You got {session.taps} taps, needed {session.target}.", False
+
+
+@register
+class MathBattle(PooledGame):
+    kind = 'math_battle'
+    session_type = MathBattleSession
+
+    def items(self, settings):
+        operators = settings['operators']
+        if settings['terms'] < 1 or settings['max'] < 1 or not operators or set(operators) - set('+-*'):
+            raise ValueError(f'bad math_battle settings {settings}')
+        return [(f"<b>🧮 Math Battle!</b> Solve: {expression}\nReply with the answer!", str(answer))
+                for expression, answer in generated(self.generate, settings)]
+
+    @staticmethod
+    def generate(settings):
+        """A random expression and its value; * binds tighter than + and -."""
+        numbers = random.choices(range(1, settings['max'] + 1), k=settings['terms'])
+        ops = random.choices(settings['operators'], k=settings['terms'] - 1)
+        product = numbers[0]
+        parts = [str(product)]
+        total, sign = 0, 1
+        for op, number in zip(ops, numbers[1:]):
+            parts += (op, str(number))
+            if op == '*':
+                product *= number
+            else:
+                total += sign * product
+                sign, product = (1 if op == '+' else -1), number
+        return ' '.join(parts), total + sign * product
+
+    def answer(self, session, text):
+        return None, text == session.answer
+
+
+@register
+class LuckyBox(Game):
+    kind = 'lucky_box'
+
+    def __init__(self, config, dealer):
+        super().__init__(config, dealer)
+        self.prompts = {
+            level: f"<b>🎁 Pick a Lucky Box!</b> Choose a number from 1 to {boxes}\nReply with a number!"
+            for level, boxes in self.levels.items()
+        }
+
+    def start(self, user_id, chat_id, level, game_num):
+        winning_box = random.randint(1, self.levels[level])
+        return self.prompts[level], LuckyBoxSession(user_id, chat_id, level, game_num, winning_box)
+
+    def answer(self, session, text):
+        try:
+            choice = int(text)
+        except ValueError:
+            return "Please reply with a number!", None
+        return None, choice == session.winning_box
+
+
+@register
+class EmojiMemory(PooledGame):
+    kind = 'emoji_memory'
+    session_type = EmojiMemorySession
+
+    def items(self, settings):
+        if settings['length'] < 1 or not settings['emojis']:
+            raise ValueError(f'bad emoji_memory settings {settings}')
+        return [(f"<b>🧠 Emoji Memory!</b> Memorize this: {sequence}\nReply with the exact sequence!", sequence)
+                for sequence, _ in generated(self.generate, settings)]
+
+    @staticmethod
+    def generate(settings):
+        sequence = ''.join(random.choices(settings['emojis'], k=settings['length']))
+        return sequence, sequence
+
+    def answer(self, session, text):
+        return None, text == session.answer
+
+
+class GameEngine:
+    """Instantiates every configured game once and dispatches to it by kind.
+
+    Kinds are dealt through the dealer too, so a player goes through every game
+    type before meeting one again. Engines built from reloaded content share the
+    dealer, keeping players' places.
+    """
+
+    def __init__(self, config=GAMES, dealer=None):
+        self.dealer = dealer or Dealer()
+        self.games = {kind: GAME_TYPES[kind](settings, self.dealer) for kind, settings in config.items()}
+        self.kinds = tuple(self.games)
+        # Bound methods, so dispatch is a single lookup
+        self._starts = tuple(game.start for game in self.games.values())
+        self._answers = {kind: game.answer for kind, game in self.games.items()}
+        self._arms = {kind: game.arm for kind, game in self.games.items() if game.timed}
+        self._expires = {kind: game.expire for kind, game in self.games.items() if game.timed}
+
+    def start(self, user_id, chat_id, level, game_num, kind=None):
+        start = self.games[kind].start if kind else self._starts[self.dealer.deal(user_id, 'kind', len(self._starts))]
+        return start(user_id, chat_id, level, game_num)
+
+    def answer(self, session, text):
+        return self._answers[session.kind](session, text)
+
+    def is_timed(self, session):
+        return session.kind in self._expires
+
+    def arm(self, session):
+        """Start a timed session's clock; returns its deadline."""
+        self._arms[session.kind](session)
+        return session.deadline
+
+    def expire(self, session):
+        return self._expires[session.kind](session)
@@ -0,0 +1,172 @@
+import asyncio
+import bisect
+import functools
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+logger = logging.getLogger('lanka_legends')
+
+
+def setup_logging(level=logging.INFO):
+    """Route all logging through a queue so handlers never block on stream I/O.
+
+    Returns the QueueListener; call its stop() on shutdown to drain the queue.
+    """
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter('ts=%(asctime)s level=%(levelname)s logger=%(name)s msg="%(message)s"'))
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(records)]
+    root.setLevel(level)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    listener.start()
+    return listener
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name):
+        yield f'{name}{_label_text(self.labels)} {self.value}'
+
+
+class Gauge:
+    """A value read from fn() whenever metrics are rendered."""
+    kind = 'gauge'
+
+    def __init__(self, labels, fn):
+        self.labels = labels
+        self.fn = fn
+
+    def samples(self, name):
+        yield f'{name}{_label_text(self.labels)} {self.fn()}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, labels, buckets=LATENCY_BUCKETS):
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()  # observed from the store's worker threads too
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield f'{name}_bucket{_label_text((*self.labels, ("le", bound)))} {total}'
+        yield f'{name}_sum{_label_text(self.labels)} {self.sum}'
+        yield f'{name}_count{_label_text(self.labels)} {self.count}'
+
+
+class Metrics:
+    """Registry of named, labelled metrics rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._families = {}  # name -> (kind, help, {labels: metric})
+
+    def _get(self, cls, name, help_text, labels, *args):
+        kind, _, metrics = self._families.setdefault(name, (cls.kind, help_text, {}))
+        if kind != cls.kind:
+            raise ValueError(f"Metric {name} is already registered as a {kind}")
+        key = tuple(sorted(labels.items()))
+        metric = metrics.get(key)
+        if metric is None:
+            metric = metrics[key] = cls(key, *args)
+        return metric
+
+    def counter(self, name, help_text, **labels):
+        return self._get(Counter, name, help_text, labels)
+
+    def histogram(self, name, help_text, **labels):
+        return self._get(Histogram, name, help_text, labels)
+
+    def gauge(self, name, help_text, fn, **labels):
+        gauge = self._get(Gauge, name, help_text, labels, fn)
+        gauge.fn = fn  # the latest registration wins
+        return gauge
+
+    def render(self):
+        lines = []
+        for name, (kind, help_text, metrics) in self._families.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for metric in metrics.values():
+                lines.extend(metric.samples(name))
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+def instrumented(name):
+    """Decorator counting calls, errors and latency of an async update handler."""
+    def decorate(handler):
+        updates = METRICS.counter('handler_updates_total', 'Updates processed per handler', handler=name)
+        errors = METRICS.counter('handler_errors_total', 'Updates whose handler raised', handler=name)
+        latency = METRICS.histogram('handler_latency_seconds', 'Handler wall time per update', handler=name)
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            updates.inc()
+            start = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                latency.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+async def serve_metrics(host='127.0.0.1', port=9108, metrics=METRICS):
+    """Serve metrics.render() over HTTP for a Prometheus scraper or curl."""
+    async def respond(reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            if request.startswith(b'GET /metrics'):
+                status, body = '200 OK', metrics.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(respond, host, port)
+    logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,96 @@
+import bisect
+
+
+class Leaderboard:
+    """Top-N players by score, kept sorted in memory and updated incrementally.
+
+    Rendered pages are cached and only invalidated when an entry on or above
+    them changes, so /leaderboard is normally served without touching the DB.
+    """
+
+    def __init__(self, size=100, page_size=5):
+        self.size = size
+        self.page_size = page_size
+        self.loaded = False
+        self._keys = []  # sorted (-score, user_id)
+        self._entries = {}  # user_id -> (username, minutes, failures, score)
+        self._pages = {}  # page number -> rendered HTML
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def pages(self):
+        return (self.size + self.page_size - 1) // self.page_size
+
+    def load(self, rows):
+        """Seed from (user_id, username, minutes_taken, failures, score) rows."""
+        self._keys.clear()
+        self._entries.clear()
+        self._pages.clear()
+        for user_id, username, minutes, failures, score in rows:
+            self.submit(user_id, username, score, minutes or 0, failures)
+        self.loaded = True
+
+    def submit(self, user_id, username, score, minutes, failures):
+        """Record a final score; returns True if the top-N changed."""
+        if score <= 0:
+            return self.remove(user_id)
+        key = (-score, user_id)
+        old = self._entries.get(user_id)
+        if old is not None:
+            if old == (username, minutes, failures, score):
+                return False
+            old_pos = bisect.bisect_left(self._keys, (-old[3], user_id))
+            del self._keys[old_pos]
+            del self._entries[user_id]
+        elif len(self._keys) >= self.size and key > self._keys[-1]:
+            return False
+        else:
+            old_pos = len(self._keys)
+        pos = bisect.bisect_left(self._keys, key)
+        self._keys.insert(pos, key)
+        self._entries[user_id] = (username, minutes, failures, score)
+        if len(self._keys) > self.size:
+            _, dropped = self._keys.pop()
+            del self._entries[dropped]
+        self._invalidate(min(pos, old_pos))
+        return True
+
+    def remove(self, user_id):
+        old = self._entries.pop(user_id, None)
+        if old is None:
+            return False
+        pos = bisect.bisect_left(self._keys, (-old[3], user_id))
+        del self._keys[pos]
+        self._invalidate(pos)
+        return True
+
+    def _invalidate(self, position):
+        first = position // self.page_size + 1
+        for page in [p for p in self._pages if p >= first]:
+            del self._pages[page]
+
+    def page(self, number):
+        """Cached HTML for a 1-based page, or None if it lies beyond the in-memory top-N."""
+        if number > self.pages:
+            return None
+        text = self._pages.get(number)
+        if text is None:
+            start = (number - 1) * self.page_size
+            rows = [(rank, *self._entries[user_id])
+                    for rank, (_, user_id) in enumerate(self._keys[start:start + self.page_size], start + 1)]
+            text = render_page(number, rows)
+            self._pages[number] = text
+        return text
+
+
+def render_page(number, rows):
+    """Render (rank, username, minutes, failures, score) rows."""
+    if not rows:
+        return "No legends yet! Be the first! 🏆" if number == 1 else f"No legends on page {number} yet! 🏆"
+    title = "Lanka Legends Leaderboard" if number == 1 else f"Lanka Legends Leaderboard — Page {number}"
+    text = f"<b>🏆 {title} 🏆</b>\n\n"
+    for rank, username, minutes, failures, score in rows:
+        text += f"{rank}. {username} - Score: {score} (Time: {minutes}m, Fails: {failures})\n"
+    return text
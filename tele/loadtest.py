@@ -0,0 +1,148 @@
+"""Load test: replay synthetic updates through the full Application against a fake Bot API.
+
+Every update goes through PTB's update queue, the update processor and the real
+handlers and store; only Telegram is replaced. Prints updates/sec and update
+latency for each --concurrency value, e.g. to compare sequential processing (1)
+with per-user concurrent processing.
+
+Run from the tele directory: python loadtest.py --users 200 --updates 20 --concurrency 1 256
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+
+from telegram import Update
+from telegram.ext import TypeHandler
+from telegram.request import BaseRequest
+
+from storage import PlayerStore
+from test_bot import build_app
+
+ANSWERS = ('Colombo', 'Lion', 'tap', '5', '45', '1', '3', '😀😺😀', '/roll', 'no idea')
+
+
+class FakeBotAPI(BaseRequest):
+    """Answers Bot API calls locally after latency seconds, as Telegram would."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.sent = 0
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        await asyncio.sleep(self.latency)
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Lanka Legends', 'username': 'lanka_legends_bot'}
+        elif endpoint == 'sendMessage':
+            self.sent += 1
+            result = {'message_id': next(self._message_ids), 'date': int(time.time()), 'text': params['text'],
+                      'chat': {'id': params['chat_id'], 'type': 'private'}}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def message_update(update_id, user_id, **fields):
+    """Raw update dict for a message from user_id in their private chat with the bot."""
+    sender = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}', 'username': f'user{user_id}'}
+    message = {'message_id': update_id, 'date': int(time.time()), 'from': sender,
+               'chat': {'id': user_id, 'type': 'private'}, **fields}
+    text = fields.get('text', '')
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def synthetic_updates(users, per_user, seed=1):
+    """Each user joins, invites two friends, then answers games; users are interleaved at random."""
+    rng = random.Random(seed)
+    scripts = {}
+    for user_id in range(1, users + 1):
+        friends = [{'id': 10_000_000 + user_id * 2 + i, 'is_bot': False, 'first_name': 'friend'} for i in range(2)]
+        scripts[user_id] = [{'text': '/start'}, {'new_chat_members': friends}]
+        scripts[user_id] += [{'text': rng.choice(ANSWERS)} for _ in range(per_user - 2)]
+    pending = {user_id: iter(script) for user_id, script in scripts.items()}
+    updates = []
+    while pending:
+        user_id = rng.choice(list(pending))
+        fields = next(pending[user_id], None)
+        if fields is None:
+            del pending[user_id]
+            continue
+        updates.append(message_update(len(updates) + 1, user_id, **fields))
+    return updates
+
+
+async def replay(updates, concurrency, api_latency, path):
+    api = FakeBotAPI(api_latency)
+    app, bot = build_app(request=api, concurrency=concurrency, store=PlayerStore(path), token='1:loadtest')
+    # The fake API has no flood limits, so don't let the outbox impose them
+    bot.outbox.global_rate = bot.outbox.chat_rate = bot.outbox.chat_burst = 1e9
+    enqueued = {}
+    latencies = []
+    finished = asyncio.Event()
+
+    async def done(update, context):
+        latencies.append(time.perf_counter() - enqueued[update.update_id])
+        if len(latencies) == len(updates):
+            finished.set()
+
+    app.add_handler(TypeHandler(Update, done), group=1)  # runs after the bot's own handler
+    async with app:
+        await bot.open()
+        await app.start()
+        start = time.perf_counter()
+        for data in updates:
+            update = Update.de_json(data, app.bot)
+            enqueued[update.update_id] = time.perf_counter()
+            app.update_queue.put_nowait(update)
+        await finished.wait()
+        elapsed = time.perf_counter() - start
+        await app.stop()
+        await bot.close()
+    latencies.sort()
+    return {
+        'updates_per_sec': len(updates) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'messages_sent': api.sent,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=20, help='updates per user (at least 2)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 256])
+    parser.add_argument('--api-latency', type=float, default=0.05, help='seconds per fake Bot API call')
+    args = parser.parse_args()
+
+    updates = synthetic_updates(args.users, max(args.updates, 2))
+    print(f"{len(updates)} updates from {args.users} users, Bot API latency {args.api_latency * 1000:.0f} ms")
+    for concurrency in args.concurrency:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = await replay(updates, concurrency, args.api_latency, os.path.join(tmp, 'load.db'))
+        print(f"concurrency {concurrency:>4}: {result['updates_per_sec']:8.0f} updates/s  "
+              f"p50 {result['p50_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  "
+              f"{result['messages_sent']} messages sent")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+import logging
+
+logger = logging.getLogger('lanka_legends.migrations')
+
+# Schema changes in order; after applying MIGRATIONS[n - 1] the database is at PRAGMA user_version n.
+# Never edit a released step: add a new one.
+MIGRATIONS = []
+
+
+def migration(step):
+    MIGRATIONS.append(step)
+    return step
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+@migration
+def initial_schema(conn):
+    """players, invites and game_sessions as they were before migrations existed"""
+    invite_columns = _columns(conn, 'invites')
+    if invite_columns and 'inviter_id' not in invite_columns:
+        # The old group bot's per-group counters (group_id, user_id, invite_count); keep them aside
+        conn.execute('ALTER TABLE invites RENAME TO legacy_group_invites')
+    conn.execute('''CREATE TABLE IF NOT EXISTS players
+                    (
+                        user_id      INTEGER PRIMARY KEY,
+                        username     TEXT,
+                        level        INTEGER DEFAULT 0,
+                        lives        INTEGER DEFAULT 2,
+                        current_game INTEGER DEFAULT 0,
+                        invites      INTEGER DEFAULT 0,
+                        start_time   REAL,
+                        failures     INTEGER DEFAULT 0,
+                        score        INTEGER DEFAULT 0
+                    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS invites
+                    (
+                        inviter_id INTEGER,
+                        invitee_id INTEGER,
+                        timestamp  REAL
+                    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_players_score ON players (score)')
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_invites_pair'").fetchone():
+        # Older databases may already hold repeated invites; keep the first of each pair
+        conn.execute('DELETE FROM invites WHERE rowid NOT IN '
+                     '(SELECT MIN(rowid) FROM invites GROUP BY inviter_id, invitee_id)')
+        conn.execute('CREATE UNIQUE INDEX idx_invites_pair ON invites (inviter_id, invitee_id)')
+    conn.execute('''CREATE TABLE IF NOT EXISTS game_sessions
+                    (
+                        user_id    INTEGER PRIMARY KEY,
+                        kind       TEXT,
+                        chat_id    INTEGER,
+                        level      INTEGER,
+                        game_num   INTEGER,
+                        expires_at REAL,
+                        payload    TEXT
+                    )''')
+
+
+@migration
+def invites_keyed_by_pair(conn):
+    """store invites clustered by (inviter_id, invitee_id), indexed by invitee_id"""
+    # WITHOUT ROWID makes the pair the table's own b-tree key, so the unique index that
+    # duplicated every row goes away and an inviter's invites sit on adjacent pages
+    conn.execute('''CREATE TABLE invites_by_pair
+                    (
+                        inviter_id INTEGER NOT NULL,
+                        invitee_id INTEGER NOT NULL,
+                        timestamp  REAL,
+                        PRIMARY KEY (inviter_id, invitee_id)
+                    ) WITHOUT ROWID''')
+    conn.execute('INSERT OR IGNORE INTO invites_by_pair SELECT inviter_id, invitee_id, timestamp FROM invites '
+                 'WHERE inviter_id IS NOT NULL AND invitee_id IS NOT NULL ORDER BY inviter_id, invitee_id')
+    conn.execute('DROP TABLE invites')
+    conn.execute('ALTER TABLE invites_by_pair RENAME TO invites')
+    conn.execute('CREATE INDEX idx_invites_invitee ON invites (invitee_id)')
+
+
+@migration
+def ranking_and_expiry_indexes(conn):
+    """partial score index in leaderboard order; game_sessions indexed by expiry"""
+    # Most players never finish, so indexing only score > 0 keeps the index small and
+    # leaves their updates untouched; (score DESC, user_id) matches top_players' ORDER BY
+    conn.execute('DROP INDEX IF EXISTS idx_players_score')
+    conn.execute('CREATE INDEX idx_players_ranking ON players (score DESC, user_id) WHERE score > 0')
+    conn.execute('CREATE INDEX idx_game_sessions_expiry ON game_sessions (expires_at)')
+
+
+@migration
+def minutes_taken(conn):
+    """players.minutes_taken: the minutes a finished player took, fixed at completion"""
+    conn.execute('ALTER TABLE players ADD COLUMN minutes_taken INTEGER')
+    # Finished players' scores are 1000 - 5 * minutes - 20 * failures, so their minutes can be recovered
+    conn.execute('UPDATE players SET minutes_taken = (1000 - score - 20 * failures) / 5 WHERE level = 4')
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations, each in its own transaction; returns the version found on disk.
+
+    BEGIN IMMEDIATE takes the write lock before the version is read, so shard
+    workers starting together migrate once between them.
+    """
+    target = len(MIGRATIONS) if target is None else target
+    found = schema_version(conn)
+    if found > len(MIGRATIONS):
+        raise RuntimeError(f"Database schema v{found} is newer than this code (v{len(MIGRATIONS)})")
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        version = schema_version(conn)
+        if version >= target:
+            conn.commit()
+            break
+        step = MIGRATIONS[version]
+        logger.info("Migrating schema to v%s: %s", version + 1, step.__doc__)
+        try:
+            step(conn)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    if schema_version(conn) != found:
+        # Fresh statistics for the new indexes; analysis_limit keeps this quick on big tables
+        conn.execute('PRAGMA analysis_limit = 1000')
+        conn.execute('ANALYZE')
+        conn.commit()
+    return found
+
+
+def check_query_plans(conn, queries):
+    """EXPLAIN QUERY PLAN each (sql, params) in queries; returns the plan lines that
+    scan a whole table or sort through a temporary b-tree."""
+    problems = []
+    for sql, params in queries:
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params):
+            detail = row[-1]
+            if (detail.startswith('SCAN') and 'USING' not in detail) or 'TEMP B-TREE' in detail:
+                problems.append(f'{detail}  <-  {sql}')
+    return problems
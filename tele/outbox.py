@@ -0,0 +1,225 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import deque
+from datetime import timedelta
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from instrumentation import METRICS
+
+logger = logging.getLogger('lanka_legends.outbox')
+
+PRIORITY_GAME = 0  # prompts and results of a game in progress
+PRIORITY_INFO = 1  # everything else
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Message:
+    __slots__ = ('text', 'priority', 'parse_mode', 'futures', 'attempts')
+
+    def __init__(self, text, priority, parse_mode, future):
+        self.text = text
+        self.priority = priority
+        self.parse_mode = parse_mode
+        self.futures = [future]
+        self.attempts = 0
+
+
+class _Chat:
+    __slots__ = ('bucket', 'pending', 'in_flight', 'ready')
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.pending = deque()
+        self.in_flight = False
+        self.ready = False
+
+
+class Outbox:
+    """Sends bot messages in the background within Telegram's flood limits.
+
+    Handlers post() and move on. Messages to one chat keep their order and
+    consecutive ones are merged into a single message while they wait; across
+    chats, game messages are sent before informational ones. A 429 pauses all
+    sending for the requested time instead of stalling a handler.
+
+    send is any coroutine function with Bot.send_message's (chat_id, text,
+    parse_mode=...) signature, so a fake Bot API can be swapped in locally.
+    """
+
+    def __init__(self, send, global_rate=30, chat_rate=1, chat_burst=3, max_retries=5):
+        self.send = send
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chats = {}
+        self._ready = []  # (priority, seq, chat_id)
+        self._seq = itertools.count()
+        self._global = None
+        self._paused_until = 0
+        self._wakeup = asyncio.Event()
+        self._worker = None
+        self._deliveries = set()
+        self._sent = METRICS.counter('outbox_messages_sent_total', 'Messages delivered to the Bot API')
+        self._merged = METRICS.counter('outbox_messages_merged_total', 'Replies merged into a queued message')
+        self._retries = METRICS.counter('outbox_retries_total', 'Sends retried after a 429 or network error')
+        METRICS.gauge('outbox_pending_messages', 'Messages waiting to be sent',
+                      lambda: sum(len(chat.pending) for chat in self._chats.values()))
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._global = TokenBucket(self.global_rate, self.global_rate, loop.time())
+        self._worker = loop.create_task(self._run())
+
+    async def close(self, timeout=10):
+        """Give queued messages up to timeout seconds to go out, then stop."""
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %s unsent messages on shutdown",
+                           sum(len(chat.pending) for chat in self._chats.values()))
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def drain(self):
+        while any(chat.pending or chat.in_flight for chat in self._chats.values()):
+            await asyncio.sleep(0.05)
+
+    def post(self, chat_id, text, priority=PRIORITY_INFO, parse_mode=ParseMode.HTML):
+        """Queue a message; returns a future resolved once it is delivered."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future.add_done_callback(_report_failure)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst, loop.time()))
+        tail = chat.pending[-1] if chat.pending else None
+        # A message that has been attempted may be rejected again; don't drag new replies down with it
+        if (tail is not None and not tail.attempts and tail.parse_mode == parse_mode
+                and len(tail.text) + len(text) + 2 <= MAX_MESSAGE_LENGTH):
+            tail.text += '\n\n' + text
+            tail.priority = min(tail.priority, priority)
+            tail.futures.append(future)
+            self._merged.inc()
+        else:
+            chat.pending.append(_Message(text, priority, parse_mode, future))
+        self._make_ready(chat_id)
+        return future
+
+    def _make_ready(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is None or chat.ready or chat.in_flight or not chat.pending:
+            return
+        chat.ready = True
+        heapq.heappush(self._ready, (chat.pending[0].priority, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = loop.time()
+            wait = max(self._global.delay(now), self._paused_until - now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, chat_id = heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+            chat.ready = False
+            chat_wait = chat.bucket.delay(now)
+            if chat_wait > 0:
+                loop.call_later(chat_wait, self._make_ready, chat_id)
+                continue
+            chat.bucket.take()
+            self._global.take()
+            chat.in_flight = True
+            task = loop.create_task(self._deliver(chat_id, chat, chat.pending.popleft()))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, chat_id, chat, message):
+        loop = asyncio.get_running_loop()
+        error = None
+        retry_in = 0
+        try:
+            await self.send(chat_id, message.text, parse_mode=message.parse_mode)
+        except RetryAfter as e:
+            error = e
+            retry_in = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            # Flood control applies to the whole bot, so hold every chat back
+            self._paused_until = max(self._paused_until, loop.time() + retry_in)
+        except (BadRequest, Forbidden) as e:
+            error = e  # permanent (bad markup, unknown or blocked chat); BadRequest is a NetworkError in PTB
+        except NetworkError as e:
+            error = e
+            retry_in = min(2 ** message.attempts, 30)
+        except Exception as e:
+            error = e
+        else:
+            self._sent.inc()
+
+        if retry_in and message.attempts < self.max_retries:
+            # Keep the chat marked in flight so nothing overtakes the retried message
+            message.attempts += 1
+            self._retries.inc()
+            chat.pending.appendleft(message)
+            loop.call_later(retry_in, self._release, chat_id)
+            return
+        self._finish(message, error)
+        self._release(chat_id)
+
+    def _release(self, chat_id):
+        chat = self._chats[chat_id]
+        chat.in_flight = False
+        if chat.pending:
+            self._make_ready(chat_id)
+        else:
+            asyncio.get_running_loop().call_later(self.chat_burst / self.chat_rate, self._forget, chat_id)
+
+    def _forget(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is not None and not chat.pending and not chat.in_flight:
+            del self._chats[chat_id]
+
+    @staticmethod
+    def _finish(message, error=None):
+        for future in message.futures:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+
+def _report_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Failed to send message: %s", future.exception())
@@ -0,0 +1,86 @@
+import asyncio
+import heapq
+import itertools
+
+
+class DeadlineScheduler:
+    """Runs a callback per key at a time.monotonic() deadline.
+
+    All deadlines share one heap and a single event-loop timer armed for the
+    earliest of them, so thousands of pending games cost one timer handle.
+    Scheduling a key again replaces its previous deadline.
+    """
+
+    def __init__(self):
+        self._heap = []  # (deadline, seq, key); may hold stale entries
+        self._entries = {}  # key -> (deadline, seq, callback)
+        self._seq = itertools.count()
+        self._timer = None
+        self._timer_at = None
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, deadline, callback):
+        """Call the coroutine function callback() once deadline has passed."""
+        seq = next(self._seq)
+        self._entries[key] = (deadline, seq, callback)
+        heapq.heappush(self._heap, (deadline, seq, key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+        self._arm()
+
+    def cancel(self, key):
+        return self._entries.pop(key, None) is not None
+
+    def _compact(self):
+        self._heap = [(deadline, seq, key) for key, (deadline, seq, _) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def _is_live(self, deadline, seq, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] == seq
+
+    def _arm(self):
+        while self._heap and not self._is_live(*self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = self._timer_at = None
+            return
+        deadline = self._heap[0][0]
+        if self._timer is not None and self._timer_at <= deadline:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_at(deadline, self._fire)
+        self._timer_at = deadline
+
+    def _fire(self):
+        self._timer = self._timer_at = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, seq, key = heapq.heappop(self._heap)
+            if not self._is_live(deadline, seq, key):
+                continue
+            _, _, callback = self._entries.pop(key)
+            task = loop.create_task(callback())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._arm()
+
+    async def close(self):
+        """Drop pending deadlines and wait for callbacks already running."""
+        self._entries.clear()
+        self._heap.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = self._timer_at = None
+        if self._tasks:
+            await asyncio.wait(self._tasks)
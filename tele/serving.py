@@ -0,0 +1,222 @@
+import asyncio
+import hmac
+import json
+import logging
+
+import httpx
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from instrumentation import METRICS
+
+logger = logging.getLogger('lanka_legends.serving')
+
+WEBHOOK_PATH = '/telegram'
+MAX_BODY = 1 << 20
+_UNBOUNDED = 1 << 30  # a semaphore limit no process reaches
+
+
+def shard_of(user_id, shards):
+    """Worker index for a user. Telegram ids are integers, so this is stable across processes."""
+    return (user_id or 0) % shards
+
+
+def update_user_id(data):
+    """Sender id of a raw update dict, falling back to its chat; None if it has neither."""
+    for key, value in data.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        for field in ('from', 'user', 'chat'):
+            if isinstance(value.get(field), dict):
+                return value[field].get('id')
+    return None
+
+
+def _update_key(update):
+    # Same precedence as update_user_id(), so routing and serialization agree
+    if isinstance(update, Update):
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently, except that one user's updates run one at a time.
+
+    Updates are started in arrival order and asyncio.Lock wakes waiters FIFO, so
+    each user's updates are handled in the order Telegram sent them while other
+    users' updates proceed in parallel. The concurrency limit is taken only once
+    an update holds its user's lock: the base class's semaphore, taken before
+    do_process_update, would let one user's queued updates hold every slot while
+    they wait on each other, so it is given a limit that never binds.
+    """
+
+    def __init__(self, max_concurrent_updates=256):
+        super().__init__(_UNBOUNDED)
+        self.concurrency = max_concurrent_updates
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks = {}  # key -> [lock, updates holding or waiting for it]
+
+    async def do_process_update(self, update, coroutine):
+        key = _update_key(update)
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._running:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+async def _read_request(reader):
+    """Next HTTP/1.1 request as (method, path, headers, body); None once the peer hangs up."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    request_line, *lines = head.decode('latin-1').split('\r\n')
+    method, path, _ = request_line.split(' ', 2)
+    headers = {}
+    for line in lines:
+        name, _, value = line.partition(':')
+        if value:
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY:
+        raise ValueError(f"Request body of {length} bytes is too large")
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+async def serve_webhook(handle, host, port, path=WEBHOOK_PATH, secret_token=None, ssl=None):
+    """Accept webhook POSTs at path and pass each raw body to the coroutine handle(body).
+
+    handle returns True once the update is accepted, or False to answer 503 so
+    Telegram redelivers it later; a ValueError from it answers 400. Connections
+    are kept alive, as Telegram reuses up to max_connections of them.
+    """
+    received = METRICS.counter('webhook_requests_total', 'Webhook POSTs accepted')
+
+    async def serve(reader, writer):
+        try:
+            while (request := await _read_request(reader)) is not None:
+                method, target, headers, body = request
+                if method != 'POST' or target != path:
+                    status = '404 Not Found'
+                elif secret_token and not hmac.compare_digest(
+                        headers.get('x-telegram-bot-api-secret-token', ''), secret_token):
+                    status = '403 Forbidden'
+                else:
+                    try:
+                        status = '200 OK' if await handle(body) else '503 Service Unavailable'
+                    except ValueError as e:
+                        logger.warning("Rejected webhook body: %s", e)
+                        status = '400 Bad Request'
+                received.inc()
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Length: 0\r\n\r\n'.encode())
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(serve, host, port, ssl=ssl, backlog=1024)
+    logger.info("Receiving updates on %s://%s:%s%s", 'https' if ssl else 'http', host, port, path)
+    return server
+
+
+def queue_updates(app):
+    """A serve_webhook() handler feeding updates, or lists of them, into app's update queue."""
+    async def handle(body):
+        data = json.loads(body)
+        for item in data if isinstance(data, list) else (data,):
+            await app.update_queue.put(Update.de_json(item, app.bot))
+        return True
+    return handle
+
+
+class ShardRouter:
+    """Forwards webhook bodies to worker processes chosen by shard_of(update_user_id()).
+
+    Each worker has one ordered queue drained by one forwarding task, which posts
+    whatever has piled up as a single JSON array. A user always maps to the same
+    worker, so their updates arrive there in the order Telegram sent them.
+    """
+
+    def __init__(self, worker_urls, max_pending=10000, max_batch=100):
+        self.worker_urls = worker_urls
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self._queues = []
+        self._tasks = []
+        self._client = None
+        self._forwarded = METRICS.counter('router_updates_forwarded_total', 'Updates delivered to a worker')
+        METRICS.gauge('router_pending_updates', 'Updates waiting to be forwarded',
+                      lambda: sum(queue.qsize() for queue in self._queues))
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._client = httpx.AsyncClient(timeout=10)
+        self._queues = [asyncio.Queue(self.max_pending) for _ in self.worker_urls]
+        self._tasks = [loop.create_task(self._forward(url, queue))
+                       for url, queue in zip(self.worker_urls, self._queues)]
+
+    async def close(self, timeout=10):
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %s unforwarded updates on shutdown",
+                           sum(queue.qsize() for queue in self._queues))
+        for task in self._tasks:
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def handle(self, body):
+        shard = shard_of(update_user_id(json.loads(body)), len(self.worker_urls))
+        queue = self._queues[shard]
+        if queue.full():
+            return False  # the worker is behind; let Telegram retry
+        queue.put_nowait(body)
+        return True
+
+    async def _forward(self, url, queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            await self._post(url, b'[' + b','.join(batch) + b']')
+            self._forwarded.inc(len(batch))
+            for _ in batch:
+                queue.task_done()
+
+    async def _post(self, url, body):
+        delay = 0.1
+        while True:
+            try:
+                response = await self._client.post(url, content=body, headers={'Content-Type': 'application/json'})
+            except httpx.TransportError as e:
+                logger.warning("Worker %s unreachable (%s), retrying in %.1fs", url, e, delay)
+            else:
+                if response.status_code < 500:
+                    if response.status_code != 200:
+                        logger.error("Worker %s rejected updates with %s", url, response.status_code)
+                    return
+                logger.warning("Worker %s answered %s, retrying in %.1fs", url, response.status_code, delay)
+            # Retrying in place keeps the user's updates in order
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5)
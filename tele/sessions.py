@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger('lanka_legends.sessions')
+
+
+class GameSession:
+    """One in-flight game. Subclasses add the few fields their game needs."""
+    __slots__ = ('user_id', 'chat_id', 'level', 'game_num', 'expires_at')
+    kind = None
+    fields = ()
+
+    def to_row(self):
+        payload = json.dumps([getattr(self, name) for name in self.fields])
+        return self.user_id, self.kind, self.chat_id, self.level, self.game_num, self.expires_at, payload
+
+    @staticmethod
+    def from_row(row):
+        user_id, kind, chat_id, level, game_num, expires_at, payload = row
+        return SESSION_TYPES[kind](user_id, chat_id, level, game_num, *json.loads(payload), expires_at=expires_at)
+
+
+class TriviaSession(GameSession):
+    __slots__ = fields = ('answer',)
+    kind = 'trivia'
+
+    def __init__(self, user_id, chat_id, level, game_num, answer, expires_at=0.0):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.level = level
+        self.game_num = game_num
+        self.expires_at = expires_at
+        self.answer = answer
+
+
+class DiceDuelSession(GameSession):
+    __slots__ = fields = ('target',)
+    kind = 'dice_duel'
+
+    def __init__(self, user_id, chat_id, level, game_num, target, expires_at=0.0):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.level = level
+        self.game_num = game_num
+        self.expires_at = expires_at
+        self.target = target
+
+
+class TapFastSession(GameSession):
+    __slots__ = fields = ('target', 'deadline', 'taps')  # deadline is on the time.monotonic() clock
+    kind = 'tap_fast'
+
+    def __init__(self, user_id, chat_id, level, game_num, target, deadline, taps, expires_at=0.0):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.level = level
+        self.game_num = game_num
+        self.expires_at = expires_at
+        self.target = target
+        self.deadline = deadline
+        self.taps = taps
+
+
+class MathBattleSession(GameSession):
+    __slots__ = fields = ('answer',)
+    kind = 'math_battle'
+
+    def __init__(self, user_id, chat_id, level, game_num, answer, expires_at=0.0):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.level = level
+        self.game_num = game_num
+        self.expires_at = expires_at
+        self.answer = answer
+
+
+class LuckyBoxSession(GameSession):
+    __slots__ = fields = ('winning_box',)
+    kind = 'lucky_box'
+
+    def __init__(self, user_id, chat_id, level, game_num, winning_box, expires_at=0.0):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.level = level
+        self.game_num = game_num
+        self.expires_at = expires_at
+        self.winning_box = winning_box
+
+
+class EmojiMemorySession(GameSession):
+    __slots__ = fields = ('answer',)
+    kind = 'emoji_memory'
+
+    def __init__(self, user_id, chat_id, level, game_num, answer, expires_at=0.0):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.level = level
+        self.game_num = game_num
+        self.expires_at = expires_at
+        self.answer = answer
+
+
+SESSION_TYPES = {cls.kind: cls for cls in (TriviaSession, DiceDuelSession, TapFastSession, MathBattleSession,
+                                           LuckyBoxSession, EmojiMemorySession)}
+
+
+class SessionStore:
+    """Active games keyed by user_id, mirrored to a persistence backend.
+
+    Sessions expire ttl seconds after they were last stored; a background task
+    reaps expired ones every reap_interval seconds. When the backend is shared by
+    several processes, owns(user_id) picks the sessions this one restores.
+    """
+
+    def __init__(self, backend=None, ttl=3600, reap_interval=60, owns=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.reap_interval = reap_interval
+        self.owns = owns
+        self._sessions = {}
+        self._reaper = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    async def open(self):
+        if self.backend is not None:
+            now = time.time()
+            for session in await self.backend.load():
+                if session.expires_at > now and (self.owns is None or self.owns(session.user_id)):
+                    self._sessions[session.user_id] = session
+        self._reaper = asyncio.get_running_loop().create_task(self._reap_forever())
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        if self.backend is not None:
+            await self.backend.close()
+
+    def get(self, user_id):
+        session = self._sessions.get(user_id)
+        if session is not None and session.expires_at <= time.time():
+            self.pop(user_id)
+            return None
+        return session
+
+    def put(self, session):
+        session.expires_at = time.time() + self.ttl
+        self._sessions[session.user_id] = session
+        if self.backend is not None:
+            self.backend.save(session)
+
+    def pop(self, user_id):
+        session = self._sessions.pop(user_id, None)
+        if session is not None and self.backend is not None:
+            self.backend.delete(user_id)
+        return session
+
+    def reap(self, now=None):
+        """Drop expired sessions; returns how many were removed."""
+        now = now or time.time()
+        expired = [user_id for user_id, session in self._sessions.items() if session.expires_at <= now]
+        for user_id in expired:
+            del self._sessions[user_id]
+        if self.backend is not None:
+            self.backend.purge(now)
+        return len(expired)
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            removed = self.reap()
+            if removed:
+                logger.info("Reaped %s abandoned game sessions", removed)
+
+
+class SqliteSessionBackend:
+    """Persists sessions in the game_sessions table through a PlayerStore."""
+
+    def __init__(self, store):
+        self.store = store
+
+    async def load(self):
+        return [GameSession.from_row(row) for row in await self.store.load_sessions()]
+
+    def save(self, session):
+        self.store.save_session(session.to_row())
+
+    def delete(self, user_id):
+        self.store.delete_session(user_id)
+
+    def purge(self, now):
+        self.store.purge_sessions(now)
+
+    async def close(self):
+        pass
+
+
+class SnapshotSessionBackend:
+    """Persists sessions as a JSON snapshot file rewritten every interval seconds."""
+
+    def __init__(self, path='game_sessions.json', interval=5):
+        self.path = path
+        self.interval = interval
+        self._rows = {}
+        self._dirty = False
+        self._writer = None
+
+    async def load(self):
+        self._writer = asyncio.get_running_loop().create_task(self._write_forever())
+        if not os.path.exists(self.path):
+            return []
+        rows = await asyncio.to_thread(_read_snapshot, self.path)
+        self._rows = {row[0]: tuple(row) for row in rows}
+        return [GameSession.from_row(row) for row in self._rows.values()]
+
+    def save(self, session):
+        self._rows[session.user_id] = session.to_row()
+        self._dirty = True
+
+    def delete(self, user_id):
+        if self._rows.pop(user_id, None) is not None:
+            self._dirty = True
+
+    def purge(self, now):
+        expired = [user_id for user_id, row in self._rows.items() if row[5] <= now]
+        for user_id in expired:
+            del self._rows[user_id]
+        self._dirty = self._dirty or bool(expired)
+
+    async def flush(self):
+        if self._dirty:
+            self._dirty = False
+            await asyncio.to_thread(_write_snapshot, self.path, list(self._rows.values()))
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        await self.flush()
+
+    async def _write_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+def _read_snapshot(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_snapshot(path, rows):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False)
+    os.replace(tmp, path)
@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import Player, PlayerCache
+from instrumentation import METRICS
+from migrations import check_query_plans, migrate
+
+logger = logging.getLogger('lanka_legends.storage')
+
+PLAYER_COLUMNS = Player.__slots__
+
+
+SELECT_PLAYER = 'SELECT * FROM players WHERE user_id = ?'
+SELECT_TOP = ('SELECT user_id, username, minutes_taken, failures, score FROM players '
+              'WHERE score > 0 ORDER BY score DESC, user_id LIMIT ? OFFSET ?')
+PURGE_SESSIONS = 'DELETE FROM game_sessions WHERE expires_at <= ?'
+
+# Statements run on every request or reap, with sample parameters; init_db() checks their plans
+HOT_QUERIES = [(SELECT_PLAYER, (1,)), (SELECT_TOP, (5, 0)), (PURGE_SESSIONS, (0.0,))]
+
+
+def init_db(path='lanka_legends.db'):
+    """Open the database in WAL mode and migrate it to the current schema."""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA busy_timeout = 5000')
+    migrate(conn)
+    for problem in check_query_plans(conn, HOT_QUERIES):
+        logger.warning("Unindexed query plan: %s", problem)
+    return conn
+
+
+# SQLite synchronous level per durability mode. 'lazy' additionally lets update_player()
+# return before its batch is committed.
+DURABILITY = {'full': 'FULL', 'normal': 'NORMAL', 'lazy': 'NORMAL'}
+
+
+class PlayerStore:
+    """Async access to the players/invites tables.
+
+    SQLite calls never run on the event loop: writes go through a single writer
+    thread (so they are serialized), reads through a small pool of reader threads,
+    each holding its own WAL-mode connection.
+
+    Writes are group-committed: operations queued by concurrent handlers are
+    applied in one transaction once batch_size ops are pending or batch_interval
+    seconds have passed, and updates to the same player in a batch are merged.
+
+    Player rows are served from an LRU cache that is updated write-through, so
+    the database only sees cache misses and writes.
+    """
+
+    def __init__(self, path='lanka_legends.db', readers=4, batch_size=500, batch_interval=0.05,
+                 durability='normal', cache_size=10000):
+        if durability not in DURABILITY:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.durability = durability
+        self.cache = PlayerCache(cache_size)
+        init_db(path).close()
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._trace = None
+        self._writer = ThreadPoolExecutor(1, 'store-writer', initializer=self._connect, initargs=(False,))
+        self._readers = ThreadPoolExecutor(readers, 'store-reader', initializer=self._connect, initargs=(True,))
+        self._batch = []
+        self._batch_updates = {}  # user_id -> queued update op, for merging
+        self._dirty = {}  # user_id -> future of the last uncommitted write touching that player
+        self._flush_timer = None
+        self._flushing = set()
+        self._db_seconds = {}
+        self._commits = METRICS.counter('db_commits_total', 'Write batches committed')
+        self._batched_ops = METRICS.counter('db_batched_ops_total', 'Write operations committed in batches')
+        for name in ('hits', 'misses', 'evictions'):
+            METRICS.gauge(f'player_cache_{name}', f'Player cache {name} since start',
+                          lambda name=name: getattr(self.cache, name))
+        METRICS.gauge('player_cache_size', 'Players currently cached', lambda: len(self.cache))
+
+    def _connect(self, read_only):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA busy_timeout = 5000')
+        conn.execute(f'PRAGMA synchronous = {DURABILITY[self.durability]}')
+        conn.execute('PRAGMA cache_size = -16384')  # 16 MiB of page cache per connection
+        conn.execute('PRAGMA mmap_size = 268435456')  # read through a 256 MiB memory map instead of read()
+        conn.execute('PRAGMA temp_store = MEMORY')
+        if read_only:
+            conn.execute('PRAGMA query_only = ON')
+        self._local.conn = conn
+        with self._lock:
+            if self._trace is not None:
+                conn.set_trace_callback(self._trace)
+            self._connections.append(conn)
+
+    def set_trace_callback(self, callback):
+        """Have every connection call callback(sql) per statement, from the worker threads; None stops it."""
+        with self._lock:
+            self._trace = callback
+            for conn in self._connections:
+                conn.set_trace_callback(callback)
+
+    def _call(self, fn, args):
+        timer = self._db_seconds.get(fn)
+        if timer is None:
+            timer = self._db_seconds[fn] = METRICS.histogram('db_seconds', 'Time spent in SQLite per call',
+                                                             op=fn.__name__.lstrip('_'))
+        start = time.perf_counter()
+        try:
+            return fn(self._local.conn, *args)
+        finally:
+            timer.observe(time.perf_counter() - start)
+
+    async def _read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._call, fn, args)
+
+    def _enqueue(self, user_id, fn, *args):
+        """Queue a write for the next batch; user_id is None for writes that don't touch players."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch.append((fn, args, future))
+        if user_id is not None:
+            self._batch_updates.pop(user_id, None)
+            self._dirty[user_id] = future
+            future.add_done_callback(lambda f: self._write_done(user_id, f))
+        self._schedule_flush(loop)
+        return future
+
+    def _write_done(self, user_id, future):
+        if future.cancelled() or future.exception() is not None:
+            # The cached record may hold changes that never reached the database
+            self.cache.discard(user_id)
+
+    def _schedule_flush(self, loop):
+        if len(self._batch) >= self.batch_size:
+            self._start_flush(loop)
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.batch_interval, self._start_flush, loop)
+
+    def _start_flush(self, loop):
+        task = loop.create_task(self.flush())
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def flush(self):
+        """Commit everything queued so far in a single transaction."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._batch, self._batch_updates = self._batch, [], {}
+        if not batch:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._writer, self._call, _apply_batch, (batch,))
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self._commits.inc()
+            self._batched_ops.inc(len(batch))
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        for user_id, future in list(self._dirty.items()):
+            if future.done():
+                del self._dirty[user_id]
+
+    async def get_player(self, user_id):
+        player = self.cache.get(user_id)
+        if player is not None:
+            return player
+        pending = self._dirty.get(user_id)
+        if pending is not None:
+            # Read-your-writes: wait for this player's queued batch to land first
+            await asyncio.wait([pending])
+        row = await self._read(_select_player, user_id)
+        if row is None:
+            return None
+        cached = self.cache.peek(user_id)
+        if cached is not None:
+            return cached
+        player = Player(*row)
+        if user_id not in self._dirty:
+            self.cache.put(player)
+        return player
+
+    async def top_players(self, limit=5, offset=0):
+        """(user_id, username, minutes_taken, failures, score) rows with score > 0, best first."""
+        return await self._read(_select_top, limit, offset)
+
+    async def add_player(self, user_id, username, start_time):
+        """Insert a new player; returns False if the player already exists."""
+        created = await self._enqueue(user_id, _insert_player, user_id, username, start_time)
+        if created:
+            self.cache.put(Player(user_id, username, start_time=start_time))
+        return created
+
+    async def update_player(self, user_id, **fields):
+        for name in fields:
+            if name not in PLAYER_COLUMNS or name == 'user_id':
+                raise ValueError(f"Unknown player column: {name}")
+        cached = self.cache.peek(user_id)
+        if cached is not None:
+            for name, value in fields.items():
+                setattr(cached, name, value)
+        op = self._batch_updates.get(user_id)
+        if op is not None:
+            op[1][1].update(fields)
+            future = op[2]
+        else:
+            future = self._enqueue(user_id, _update_player, user_id, dict(fields))
+            self._batch_updates[user_id] = self._batch[-1]
+        if self.durability == 'lazy':
+            future.add_done_callback(_report_failure)
+            return
+        await future
+
+    async def record_invites(self, inviter_id, invitee_ids, timestamp):
+        """Store invites not seen before and bump the inviter's count by that many.
+
+        Returns (new invite count, invites added), or None if the inviter hasn't started.
+        """
+        # How many invites are new is only known once the batch runs, so reload on next read
+        self.cache.discard(inviter_id)
+        return await self._enqueue(inviter_id, _insert_invites, inviter_id, invitee_ids, timestamp)
+
+    async def load_sessions(self):
+        return await self._read(_select_sessions)
+
+    def save_session(self, row):
+        self._enqueue(None, _upsert_session, row).add_done_callback(_report_failure)
+
+    def delete_session(self, user_id):
+        self._enqueue(None, _delete_session, user_id).add_done_callback(_report_failure)
+
+    def purge_sessions(self, now):
+        self._enqueue(None, _purge_sessions, now).add_done_callback(_report_failure)
+
+    async def close(self):
+        """Flush pending writes and release every connection."""
+        await self.flush()
+        if self._flushing:
+            await asyncio.wait(self._flushing)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown)
+
+    def _shutdown(self):
+        # Refresh statistics the planner found stale during this run; cheap when nothing changed
+        self._writer.submit(lambda: self._local.conn.execute('PRAGMA optimize')).result()
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def _report_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Deferred write failed: %s", future.exception())
+
+
+def _apply_batch(conn, batch):
+    with conn:
+        return [fn(conn, *args) for fn, args, _ in batch]
+
+
+def _select_player(conn, user_id):
+    return conn.execute(SELECT_PLAYER, (user_id,)).fetchone()
+
+
+def _select_top(conn, limit, offset):
+    return conn.execute(SELECT_TOP, (limit, offset)).fetchall()
+
+
+def _insert_player(conn, user_id, username, start_time):
+    c = conn.execute('INSERT OR IGNORE INTO players (user_id, username, start_time) VALUES (?, ?, ?)',
+                     (user_id, username, start_time))
+    return c.rowcount == 1
+
+
+def _update_player(conn, user_id, fields):
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    conn.execute(f'UPDATE players SET {assignments} WHERE user_id = ?', (*fields.values(), user_id))
+
+
+def _insert_invites(conn, inviter_id, invitee_ids, timestamp):
+    if conn.execute('SELECT 1 FROM players WHERE user_id = ?', (inviter_id,)).fetchone() is None:
+        return None
+    before = conn.total_changes
+    conn.executemany('INSERT OR IGNORE INTO invites (inviter_id, invitee_id, timestamp) VALUES (?, ?, ?)',
+                     [(inviter_id, invitee_id, timestamp) for invitee_id in invitee_ids])
+    added = conn.total_changes - before
+    row = conn.execute('UPDATE players SET invites = invites + ? WHERE user_id = ? RETURNING invites',
+                       (added, inviter_id)).fetchone()
+    return row[0], added
+
+
+def _select_sessions(conn):
+    return conn.execute('SELECT user_id, kind, chat_id, level, game_num, expires_at, payload '
+                        'FROM game_sessions').fetchall()
+
+
+def _upsert_session(conn, row):
+    conn.execute('INSERT OR REPLACE INTO game_sessions (user_id, kind, chat_id, level, game_num, expires_at, payload) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+
+
+def _delete_session(conn, user_id):
+    conn.execute('DELETE FROM game_sessions WHERE user_id = ?', (user_id,))
+
+
+def _purge_sessions(conn, now):
+    conn.execute(PURGE_SESSIONS, (now,))
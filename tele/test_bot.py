@@ -1,361 +1,307 @@
 
-import sqlite3
-import random
 import time
-import nest_asyncio
-from telegram import Update
+from telegram import Bot, Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from telegram.constants import ParseMode
 from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
+import argparse
 import asyncio
-
-# Apply nest_asyncio to handle nested event loops
-nest_asyncio.apply()
-
-
-# Initialize SQLite database
-def init_db():
-    conn = sqlite3.connect('lanka_legends.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS players
-                 (
-                     user_id
-                     INTEGER
-                     PRIMARY
-                     KEY,
-                     username
-                     TEXT,
-                     level
-                     INTEGER
-                     DEFAULT
-                     0,
-                     lives
-                     INTEGER
-                     DEFAULT
-                     2,
-                     current_game
-                     INTEGER
-                     DEFAULT
-                     0,
-                     invites
-                     INTEGER
-                     DEFAULT
-                     0,
-                     start_time
-                     REAL,
-                     failures
-                     INTEGER
-                     DEFAULT
-                     0,
-                     score
-                     INTEGER
-                     DEFAULT
-                     0
-                 )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS invites
-                 (
-                     inviter_id
-                     INTEGER,
-                     invitee_id
-                     INTEGER,
-                     timestamp
-                     REAL
-                 )''')
-    conn.commit()
-    return conn
-
-
-# Game definitions
-GAMES = {
-    'trivia': {
-        'easy': [('What’s the capital of Sri Lanka?', 'Colombo'), ('Which animal is on the SL flag?', 'Lion')],
-        'medium': [('What’s the highest peak in SL?', 'Pidurutalagala'), ('What’s the longest river?', 'Mahaweli')],
-        'hard': [('Who was SL’s first Prime Minister?', 'D.S. Senanayake'),
-                 ('What year did SL gain independence?', '1948')]
-    },
-    'dice_duel': {'easy': 4, 'medium': 6, 'hard': 8},  # Target number to beat
-    'tap_fast': {'easy': 5, 'medium': 10, 'hard': 15},  # Taps needed in 5 seconds
-    'math_battle': {'easy': ('2 + 3', '5'), 'medium': ('15 * 3', '45'), 'hard': ('7 * 13', '91')},  # Expression, answer
-    'lucky_box': {'easy': 3, 'medium': 5, 'hard': 7},  # Number of boxes
-    'emoji_memory': {
-        'easy': ('😀😺😀', '😀😺😀'),
-        'medium': ('😺🐘😀😺🐘', '😺🐘😀😺🐘'),
-        'hard': ('🐘😺😀🐘😺😀', '🐘😺😀🐘😺😀')
-    }
-}
+import logging
+import os
+import secrets
+import signal
+import ssl
+import subprocess
+import sys
+import urllib.parse
+
+from content import CONTENT_PATH, ContentFile
+from games import GameEngine
+from instrumentation import METRICS, instrumented, serve_metrics, setup_logging
+from leaderboard import Leaderboard, render_page
+from outbox import PRIORITY_GAME, Outbox
+from scheduler import DeadlineScheduler
+from serving import PerUserUpdateProcessor, ShardRouter, WEBHOOK_PATH, queue_updates, serve_webhook, shard_of
+from sessions import SessionStore, SqliteSessionBackend
+from storage import PlayerStore
+
+logger = logging.getLogger('lanka_legends.bot')
+
+TOKEN = ''  # Bot API token
+METRICS_PORT = 9108
+
+
+class TimedRequest(HTTPXRequest):
+    """Records how long each Bot API call takes, per endpoint."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        timer = METRICS.histogram('telegram_api_seconds', 'Bot API request time', endpoint=url.rsplit('/', 1)[-1])
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            timer.observe(time.perf_counter() - start)
 
 
 # Bot class
 class LankaLegendsBot:
-    def __init__(self):
-        self.conn = init_db()
-        self.games = GAMES
+    def __init__(self, outbox, store=None, shard=0, shards=1, content=None):
+        self.outbox = outbox
+        self.store = store or PlayerStore()
+        self.shard = shard
+        self.shards = shards
+        self.rankings = Leaderboard()
+        owns = (lambda user_id: shard_of(user_id, shards) == shard) if shards > 1 else None
+        self.sessions = SessionStore(SqliteSessionBackend(self.store), owns=owns)
+        self._rankings_refresh = None
+        self.engine = GameEngine()
+        # Reloaded content swaps in a new engine; handlers pick it up at their next self.engine lookup
+        self.content = ContentFile(content, self.engine.dealer, self._install_engine) if content else None
+        self.scheduler = DeadlineScheduler()
         self.level_requirements = {1: 1, 2: 2, 3: 2}  # Invites needed per level
 
+    async def open(self):
+        """Warm in-memory state from the database and start background senders."""
+        await self.outbox.start()
+        if self.content is not None:
+            await self.content.start()
+        self.rankings.load(await self.store.top_players(self.rankings.size))
+        await self.sessions.open()
+        for session in self.sessions:
+            if self.engine.is_timed(session):
+                # Deadlines are on this process's monotonic clock, so a restored timed game can't be resumed
+                self.sessions.pop(session.user_id)
+        if self.shards > 1:
+            self._rankings_refresh = asyncio.get_running_loop().create_task(self._refresh_rankings())
+
+    async def close(self):
+        """Stop background work and flush everything to disk."""
+        if self._rankings_refresh is not None:
+            self._rankings_refresh.cancel()
+        if self.content is not None:
+            await self.content.close()
+        await self.scheduler.close()
+        await self.outbox.close()
+        await self.sessions.close()
+        await self.store.close()
+
+    def _install_engine(self, engine):
+        self.engine = engine
+
+    async def _refresh_rankings(self, interval=30):
+        # Other shards finish games too; pick up their scores from the shared table
+        while True:
+            await asyncio.sleep(interval)
+            self.rankings.load(await self.store.top_players(self.rankings.size))
+
+    @instrumented('start')
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
-        c = self.conn.cursor()
-        c.execute('SELECT * FROM players WHERE user_id = ?', (user.id,))
-        player = c.fetchone()
 
-        print(f"/start called by user {user.id} ({user.username or user.first_name})")  # Debug
+        logger.debug("/start called by user %s (%s)", user.id, user.username or user.first_name)
 
-        if not player:
-            c.execute('INSERT INTO players (user_id, username, start_time) VALUES (?, ?, ?)',
-                      (user.id, user.username or user.first_name, time.time()))
-            self.conn.commit()
-            await update.message.reply_text(
+        if await self.store.add_player(user.id, user.username or user.first_name, time.time()):
+            self.outbox.post(
+                update.effective_chat.id,
                 "<b>🇱🇰 Welcome to Lanka Legends: Invite & Conquer! 😎</b>\n"
-                "Invite 1 friend to join the game! Use /profile to check your status.",
-                parse_mode=ParseMode.HTML
+                "Invite 1 friend to join the game! Use /profile to check your status."
             )
         else:
-            await update.message.reply_text(
-                "<b>Aiyo, you’re already in the game! 😜</b>\nCheck /profile or keep inviting!",
-                parse_mode=ParseMode.HTML
+            self.outbox.post(
+                update.effective_chat.id,
+                "<b>Aiyo, you’re already in the game! 😜</b>\nCheck /profile or keep inviting!"
             )
 
+    @instrumented('profile')
     async def profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
-        c = self.conn.cursor()
-        c.execute('SELECT * FROM players WHERE user_id = ?', (user.id,))
-        player = c.fetchone()
+        player = await self.store.get_player(user.id)
 
-        print(f"/profile called by user {user.id}")  # Debug
+        logger.debug("/profile called by user %s", user.id)
 
         if not player:
-            await update.message.reply_text("You haven’t started yet! Use /start to join. 😎")
+            self.outbox.post(update.effective_chat.id, "You haven’t started yet! Use /start to join. 😎")
             return
 
-        level, lives, current_game, invites, start_time, failures, score = player[2:]
-        minutes = int((time.time() - start_time) / 60) if start_time else 0
-        username = player[1] or "Unknown"
+        if player.minutes_taken is not None:
+            minutes = player.minutes_taken
+        else:
+            minutes = int((time.time() - player.start_time) / 60) if player.start_time else 0
+        username = player.username or "Unknown"
 
-        await update.message.reply_text(
+        self.outbox.post(
+            update.effective_chat.id,
             "<b>🎮 Your Profile 🎮</b>\n"
             f"Username: {username}\n"
-            f"Level: {level}\n"
-            f"Lives: {lives}\n"
-            f"Current Game: {'Game ' + str(current_game + 1) if level > 0 else 'Not started'}\n"
-            f"Invites: {invites}\n"
+            f"Level: {player.level}\n"
+            f"Lives: {player.lives}\n"
+            f"Current Game: {'Game ' + str(player.current_game + 1) if player.level > 0 else 'Not started'}\n"
+            f"Invites: {player.invites}\n"
             f"Time Taken: {minutes} mins\n"
-            f"Failures: {failures}\n"
-            f"Score: {score}\n"
-            "Invite more to progress! 🇱🇰",
-            parse_mode=ParseMode.HTML
+            f"Failures: {player.failures}\n"
+            f"Score: {player.score}\n"
+            "Invite more to progress! 🇱🇰"
         )
 
+    @instrumented('leaderboard')
     async def leaderboard(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        c = self.conn.cursor()
-        c.execute(
-            'SELECT username, start_time, failures, score FROM players WHERE score > 0 ORDER BY score DESC LIMIT 5')
-        leaders = c.fetchall()
-
-        print(f"/leaderboard called")  # Debug
-
-        if not leaders:
-            await update.message.reply_text("No legends yet! Be the first! 🏆")
-            return
-
-        text = "<b>🏆 Lanka Legends Leaderboard 🏆</b>\n\n"
-        for i, (username, start_time, failures, score) in enumerate(leaders, 1):
-            minutes = int((time.time() - start_time) / 60) if start_time else 0
-            text += f"{i}. {username} - Score: {score} (Time: {minutes}m, Fails: {failures})\n"
-
-        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
-
+        try:
+            page = max(int(context.args[0]), 1) if context.args else 1
+        except ValueError:
+            page = 1
+
+        logger.debug("/leaderboard called for page %s", page)
+
+        if not self.rankings.loaded:
+            # open() hasn't run (or is still running); seed the rankings alone rather than restart everything
+            self.rankings.load(await self.store.top_players(self.rankings.size))
+        text = self.rankings.page(page)
+        if text is None:
+            # Beyond the in-memory top-N: fall back to an indexed range query
+            page_size = self.rankings.page_size
+            leaders = await self.store.top_players(page_size, (page - 1) * page_size)
+            text = render_page(page, [
+                (rank, username, minutes or 0, failures, score)
+                for rank, (_, username, minutes, failures, score) in enumerate(leaders, (page - 1) * page_size + 1)
+            ])
+
+        self.outbox.post(update.effective_chat.id, text)
+
+    @instrumented('handle_invite')
     async def handle_invite(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not update.message.new_chat_members:
-            print("No new chat members detected")  # Debug
+            logger.debug("No new chat members detected")
             return
 
         inviter_id = update.effective_user.id
         inviter_name = update.effective_user.username or update.effective_user.first_name
-        print(f"Invite detected by user {inviter_id} ({inviter_name})")  # Debug
-
-        for member in update.message.new_chat_members:
-            if member.is_bot:
-                print(f"Ignoring bot invite: {member.id}")  # Debug
-                continue  # Skip bots
-            c = self.conn.cursor()
-            c.execute('SELECT invites FROM players WHERE user_id = ?', (inviter_id,))
-            player = c.fetchone()
-            if player:
-                invites = player[0] + 1
-                c.execute('UPDATE players SET invites = ? WHERE user_id = ?', (invites, inviter_id))
-                c.execute('INSERT INTO invites (inviter_id, invitee_id, timestamp) VALUES (?, ?, ?)',
-                          (inviter_id, member.id, time.time()))
-                self.conn.commit()
-                print(f"Updated invites for {inviter_id}: {invites}")  # Debug
-                await update.message.reply_text(
-                    f"Aiyo, {inviter_name} invited someone! 😎 Invites: {invites}",
-                    parse_mode=ParseMode.HTML
-                )
-                await self.check_level_progress(update, context, inviter_id)
-            else:
-                print(f"No player found for user {inviter_id}")  # Debug
-                await update.message.reply_text(
-                    f"<b>Aiyo, {inviter_name}!</b> You need to use /start first to join the game! 😜",
-                    parse_mode=ParseMode.HTML
-                )
+        logger.debug("Invite detected by user %s (%s)", inviter_id, inviter_name)
+
+        # One batch for the whole join event; dict.fromkeys drops repeats but keeps order
+        invitee_ids = list(dict.fromkeys(member.id for member in update.message.new_chat_members
+                                         if not member.is_bot))
+        if not invitee_ids:
+            logger.debug("Ignoring bot-only invite by %s", inviter_id)
+            return
+
+        result = await self.store.record_invites(inviter_id, invitee_ids, time.time())
+        if result is None:
+            logger.debug("No player found for user %s", inviter_id)
+            self.outbox.post(
+                update.effective_chat.id,
+                f"<b>Aiyo, {inviter_name}!</b> You need to use /start first to join the game! 😜"
+            )
+            return
+
+        invites, added = result
+        logger.debug("Updated invites for %s: %s (+%s of %s)", inviter_id, invites, added, len(invitee_ids))
+        if not added:
+            return  # Everyone here was already counted for this inviter
+        invited = "someone" if added == 1 else f"{added} friends"
+        self.outbox.post(
+            update.effective_chat.id,
+            f"Aiyo, {inviter_name} invited {invited}! 😎 Invites: {invites}"
+        )
+        await self.check_level_progress(update, context, inviter_id)
 
     async def check_level_progress(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id):
-        c = self.conn.cursor()
-        c.execute('SELECT level, invites, lives, current_game FROM players WHERE user_id = ?', (user_id,))
-        player = c.fetchone()
+        player = await self.store.get_player(user_id)
         if not player:
-            print(f"No player found for user {user_id} in check_level_progress")  # Debug
+            logger.debug("No player found for user %s in check_level_progress", user_id)
             return
 
-        level, invites, lives, current_game = player
+        level, invites = player.level, player.invites
         required_invites = self.level_requirements.get(level + 1, 0)
 
-        print(
-            f"Checking progress for user {user_id}: level {level}, invites {invites}, required {required_invites}")  # Debug
+        logger.debug("Checking progress for user %s: level %s, invites %s, required %s",
+                     user_id, level, invites, required_invites)
         if invites >= required_invites and level < 3:
-            c.execute('UPDATE players SET level = ?, lives = 2, current_game = 0 WHERE user_id = ?',
-                      (level + 1, user_id))
-            self.conn.commit()
-            print(f"User {user_id} advanced to level {level + 1}")  # Debug
-            await update.message.reply_text(
-                f"<b>🎉 Congrats! You’ve reached Level {level + 1}! Let’s play a game! 😎</b>",
-                parse_mode=ParseMode.HTML
+            await self.store.update_player(user_id, level=level + 1, lives=2, current_game=0)
+            logger.info("User %s advanced to level %s", user_id, level + 1)
+            self.outbox.post(
+                update.effective_chat.id,
+                f"<b>🎉 Congrats! You’ve reached Level {level + 1}! Let’s play a game! 😎</b>"
             )
-            await self.start_game(update, context, user_id)
+            await self.start_game(update.effective_chat.id, user_id)
         else:
-            print(
-                f"User {user_id} not advanced: invites {invites} < required {required_invites} or level {level} >= 3")  # Debug
-
-    async def start_game(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id):
-        c = self.conn.cursor()
-        c.execute('SELECT level, current_game FROM players WHERE user_id = ?', (user_id,))
-        player = c.fetchone()
-        if not player or player[0] == 0:
-            print(f"No game started for user {user_id}: level 0 or no player")  # Debug
+            logger.debug("User %s not advanced: invites %s < required %s or level %s >= 3",
+                         user_id, invites, required_invites, level)
+
+    async def start_game(self, chat_id, user_id):
+        player = await self.store.get_player(user_id)
+        if not player or player.level == 0:
+            logger.debug("No game started for user %s: level 0 or no player", user_id)
             return
 
-        level, current_game = player
-        difficulty = {1: 'easy', 2: 'medium', 3: 'hard'}[level]
-        game_type = random.choice(list(self.games.keys()))
+        level, current_game = player.level, player.current_game
+        prompt, session = self.engine.start(user_id, chat_id, level, current_game)
 
-        print(f"Starting {game_type} for user {user_id}, level {level}, game {current_game + 1}")  # Debug
+        logger.debug("Starting %s for user %s, level %s, game %s", session.kind, user_id, level, current_game + 1)
 
-        if game_type == 'trivia':
-            question, answer = random.choice(self.games['trivia'][difficulty])
-            await update.message.reply_text(
-                f"<b>🧠 Trivia Time!</b> {question}\nReply with your answer!",
-                parse_mode=ParseMode.HTML
-            )
-            context.user_data['game'] = {'type': 'trivia', 'answer': answer, 'level': level, 'game_num': current_game}
-        elif game_type == 'dice_duel':
-            target = self.games['dice_duel'][difficulty]
-            await update.message.reply_text(
-                f"<b>🎲 Dice Duel!</b> Roll a number higher than {target} using /roll!\nReply with /roll",
-                parse_mode=ParseMode.HTML
-            )
-            context.user_data['game'] = {'type': 'dice_duel', 'target': target, 'level': level,
-                                         'game_num': current_game}
-        elif game_type == 'tap_fast':
-            target = self.games['tap_fast'][difficulty]
-            await update.message.reply_text(
-                f"<b>👆 Tap Fast!</b> Send 'tap' {target} times in 5 seconds!\nStart now!",
-                parse_mode=ParseMode.HTML
-            )
-            context.user_data['game'] = {
-                'type': 'tap_fast', 'target': target, 'level': level, 'game_num': current_game,
-                'start_time': time.time(), 'taps': 0
-            }
-        elif game_type == 'math_battle':
-            expression, answer = self.games['math_battle'][difficulty]
-            await update.message.reply_text(
-                f"<b>🧮 Math Battle!</b> Solve: {expression}\nReply with the answer!",
-                parse_mode=ParseMode.HTML
-            )
-            context.user_data['game'] = {'type': 'math_battle', 'answer': answer, 'level': level,
-                                         'game_num': current_game}
-        elif game_type == 'lucky_box':
-            num_boxes = self.games['lucky_box'][difficulty]
-            winning_box = random.randint(1, num_boxes)
-            await update.message.reply_text(
-                f"<b>🎁 Pick a Lucky Box!</b> Choose a number from 1 to {num_boxes}\nReply with a number!",
-                parse_mode=ParseMode.HTML
-            )
-            context.user_data['game'] = {'type': 'lucky_box', 'winning_box': winning_box, 'level': level,
-                                         'game_num': current_game}
-        elif game_type == 'emoji_memory':
-            sequence, answer = self.games['emoji_memory'][difficulty]
-            await update.message.reply_text(
-                f"<b>🧠 Emoji Memory!</b> Memorize this: {sequence}\nReply with the exact sequence!",
-                parse_mode=ParseMode.HTML
-            )
-            context.user_data['game'] = {'type': 'emoji_memory', 'answer': answer, 'level': level,
-                                         'game_num': current_game}
+        self.sessions.put(session)
+        delivered = self.outbox.post(chat_id, prompt, PRIORITY_GAME)
+        if self.engine.is_timed(session):
+            # The clock starts once the prompt is out, not while it waits behind flood limits
+            delivered.add_done_callback(lambda _: self._start_clock(session))
 
-    async def handle_game_response(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if 'game' not in context.user_data:
-            print(f"No active game for user {update.effective_user.id}")  # Debug
-            return
+    def _start_clock(self, session):
+        if self.sessions.get(session.user_id) is not session:
+            return  # Already resolved or replaced
+        deadline = self.engine.arm(session)
+        self.scheduler.schedule(session.user_id, deadline, lambda: self.expire_game(session))
 
+    @instrumented('handle_game_response')
+    async def handle_game_response(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
-        c = self.conn.cursor()
-        game = context.user_data['game']
-        text = update.message.text
-
-        print(f"Processing response for user {user.id}: {text}")  # Debug
-
-        if game['type'] == 'trivia':
-            correct = text.lower() == game['answer'].lower()
-            await self.process_game_result(update, context, user.id, correct)
-        elif game['type'] == 'dice_duel':
-            if text == '/roll':
-                roll = random.randint(1, 6)
-                correct = roll >= game['target']
-                await update.message.reply_text(
-                    f"You rolled a {roll}! {'<b>Win!</b>' if correct else '<b>Lose!</b>'}",
-                    parse_mode=ParseMode.HTML
-                )
-                await self.process_game_result(update, context, user.id, correct)
-        elif game['type'] == 'tap_fast':
-            if text.lower() == 'tap' and time.time() - game['start_time'] <= 5:
-                game['taps'] += 1
-                print(f"Tap count for user {user.id}: {game['taps']}")  # Debug
-                if game['taps'] >= game['target']:
-                    await update.message.reply_text("<b>Win!</b> You tapped fast enough! 😎", parse_mode=ParseMode.HTML)
-                    await self.process_game_result(update, context, user.id, True)
-                context.user_data['game'] = game  # Update tap count
-                return  # Don't clear game yet
-            elif time.time() - game['start_time'] > 5:
-                await update.message.reply_text(
-                    f"<b>Lose!</b> Time’s up! You got {game['taps']} taps, needed {game['target']}.",
-                    parse_mode=ParseMode.HTML
-                )
-                await self.process_game_result(update, context, user.id, False)
-        elif game['type'] == 'math_battle':
-            correct = text == game['answer']
-            await self.process_game_result(update, context, user.id, correct)
-        elif game['type'] == 'lucky_box':
-            try:
-                choice = int(text)
-                correct = choice == game['winning_box']
-                await self.process_game_result(update, context, user.id, correct)
-            except ValueError:
-                await update.message.reply_text("Please reply with a number!", parse_mode=ParseMode.HTML)
-                return
-        elif game['type'] == 'emoji_memory':
-            correct = text == game['answer']
-            await self.process_game_result(update, context, user.id, correct)
-
-        if 'game' in context.user_data and game['type'] != 'tap_fast':
-            del context.user_data['game']
-
-    async def process_game_result(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id, won):
-        c = self.conn.cursor()
-        c.execute('SELECT level, lives, current_game, failures, start_time FROM players WHERE user_id = ?', (user_id,))
-        player = c.fetchone()
-        level, lives, current_game, failures, start_time = player
-
-        print(
-            f"Game result for user {user_id}: {'Win' if won else 'Lose'}, level {level}, game {current_game + 1}")  # Debug
+        game = self.sessions.get(user.id)
+        if game is None:
+            logger.debug("No active game for user %s", user.id)
+            return
+        await self._answer(game, update.message.text)
+
+    @instrumented('roll')
+    async def roll(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/roll answers a Dice Duel; in any other game it is not an answer and is ignored."""
+        game = self.sessions.get(update.effective_user.id)
+        if game is None or game.kind != 'dice_duel':
+            logger.debug("/roll outside a Dice Duel from user %s", update.effective_user.id)
+            return
+        await self._answer(game, update.message.text)
+
+    async def _answer(self, game, text):
+        # Shared by the instrumented handlers above, so each update is counted once
+        logger.debug("Processing response for user %s: %s", game.user_id, text)
+        reply, won = self.engine.answer(game, text)
+        await self.finish_game(game, reply, won)
+
+    @instrumented('expire_game')
+    async def expire_game(self, game):
+        """Resolve a timed game whose deadline passed."""
+        if self.sessions.get(game.user_id) is not game:
+            return  # Already answered
+        logger.debug("Deadline reached for user %s: %s", game.user_id, game.kind)
+        reply, won = self.engine.expire(game)
+        await self.finish_game(game, reply, won)
+
+    async def finish_game(self, game, reply, won):
+        if reply:
+            self.outbox.post(game.chat_id, reply, PRIORITY_GAME)
+        if won is None:
+            return  # Game still in progress
+
+        # Clear this game before process_game_result deals the next one
+        if self.sessions.get(game.user_id) is game:
+            self.sessions.pop(game.user_id)
+        self.scheduler.cancel(game.user_id)
+        await self.process_game_result(game.chat_id, game.user_id, won)
+
+    async def process_game_result(self, chat_id, user_id, won):
+        player = await self.store.get_player(user_id)
+        level, lives, current_game, failures, start_time = (player.level, player.lives, player.current_game,
+                                                            player.failures, player.start_time)
+
+        logger.debug("Game result for user %s: %s, level %s, game %s",
+                     user_id, 'Win' if won else 'Lose', level, current_game + 1)
 
         if won:
             current_game += 1
@@ -363,89 +309,216 @@ class LankaLegendsBot:
                 if level == 3:
                     minutes = int((time.time() - start_time) / 60)
                     score = 1000 - (minutes * 5) - (failures * 20)
-                    c.execute('UPDATE players SET score = ?, level = 4 WHERE user_id = ?', (score, user_id))
-                    self.conn.commit()
-                    await update.message.reply_text(
+                    await self.store.update_player(user_id, score=score, level=4, minutes_taken=minutes)
+                    self.rankings.submit(user_id, player.username, score, minutes, failures)
+                    self.outbox.post(
+                        chat_id,
                         f"<b>🏆 Legend Alert!</b> You’ve conquered all levels! 🥳 Final Score: {score}",
-                        parse_mode=ParseMode.HTML
+                        PRIORITY_GAME
                     )
                     return
-                c.execute('UPDATE players SET current_game = 0, lives = 2 WHERE user_id = ?', (user_id,))
-                self.conn.commit()
-                await update.message.reply_text(
+                await self.store.update_player(user_id, current_game=0, lives=2)
+                self.outbox.post(
+                    chat_id,
                     f"<b>🎉 You won!</b> On to the next game in Level {level}! 😎",
-                    parse_mode=ParseMode.HTML
+                    PRIORITY_GAME
                 )
             else:
-                c.execute('UPDATE players SET current_game = ? WHERE user_id = ?', (current_game, user_id))
-                self.conn.commit()
-                await update.message.reply_text(
+                await self.store.update_player(user_id, current_game=current_game)
+                self.outbox.post(
+                    chat_id,
                     f"<b>🎉 Nice one!</b> Next game coming up! 😎",
-                    parse_mode=ParseMode.HTML
+                    PRIORITY_GAME
                 )
-            await self.start_game(update, context, user_id)
+            await self.start_game(chat_id, user_id)
         else:
             lives -= 1
             failures += 1
             if lives == 0:
-                c.execute('UPDATE players SET lives = 2, current_game = 0, failures = ?, invites = 0 WHERE user_id = ?',
-                          (failures, user_id))
-                self.conn.commit()
-                await update.message.reply_text(
+                await self.store.update_player(user_id, lives=2, current_game=0, failures=failures, invites=0)
+                self.outbox.post(
+                    chat_id,
                     f"<b>Aiyo, game over!</b> 😜 Invite 1 more person to retry Level {level}.",
-                    parse_mode=ParseMode.HTML
+                    PRIORITY_GAME
                 )
             else:
-                c.execute('UPDATE players SET lives = ?, failures = ? WHERE user_id = ?', (lives, failures, user_id))
-                self.conn.commit()
-                await update.message.reply_text(
+                await self.store.update_player(user_id, lives=lives, failures=failures)
+                self.outbox.post(
+                    chat_id,
                     f"<b>Oops, wrong!</b> 😅 Lives left: {lives}. Try again!",
-                    parse_mode=ParseMode.HTML
+                    PRIORITY_GAME
                 )
-                await self.start_game(update, context, user_id)
+                await self.start_game(chat_id, user_id)
 
+    @instrumented('force_game')
     async def force_game(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Manually trigger a game for testing."""
         user_id = update.effective_user.id
-        print(f"/forcegame called by user {user_id}")  # Debug
-        c = self.conn.cursor()
-        c.execute('SELECT level FROM players WHERE user_id = ?', (user_id,))
-        player = c.fetchone()
-        if not player or player[0] == 0:
-            await update.message.reply_text(
-                "<b>Aiyo!</b> You need to be on Level 1 or higher. Use /start and invite someone first! 😜",
-                parse_mode=ParseMode.HTML
+        logger.debug("/forcegame called by user %s", user_id)
+        player = await self.store.get_player(user_id)
+        if not player or player.level == 0:
+            self.outbox.post(
+                update.effective_chat.id,
+                "<b>Aiyo!</b> You need to be on Level 1 or higher. Use /start and invite someone first! 😜"
             )
             return
-        await self.start_game(update, context, user_id)
+        await self.start_game(update.effective_chat.id, user_id)
 
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors and notify the user."""
         try:
             raise context.error
         except TelegramError as e:
-            print(f"Error: {e}")  # Log the error
+            logger.error("Telegram error: %s", e, exc_info=e)
             if update and update.message:
-                await update.message.reply_text(
-                    "Aiyo, something went wrong! 😅 Please try again or contact the admin.",
-                    parse_mode=ParseMode.HTML
-                )
+                # Through the outbox, so the apology is rate limited and retried like any other reply
+                self.outbox.post(update.effective_chat.id,
+                                 "Aiyo, something went wrong! 😅 Please try again or contact the admin.")
 
 
-async def main():
-    app = Application.builder().token('').build()
-    bot = LankaLegendsBot()
+def build_app(request=None, concurrency=256, polling=False, store=None, shard=0, shards=1, token=TOKEN,
+              content=CONTENT_PATH):
+    """Create the Application and the bot behind its handlers; returns (app, bot).
+
+    Updates run concurrently, one at a time per user. The Bot API's global flood
+    limit is split evenly between shards.
+    """
+    builder = (Application.builder().token(token).request(request or TimedRequest())
+               .concurrent_updates(PerUserUpdateProcessor(concurrency)))
+    if not polling:
+        builder = builder.updater(None)
+    app = builder.build()
+    bot = LankaLegendsBot(Outbox(app.bot.send_message, global_rate=30 / shards), store, shard, shards, content)
 
     app.add_handler(CommandHandler('start', bot.start))
     app.add_handler(CommandHandler('profile', bot.profile))
     app.add_handler(CommandHandler('leaderboard', bot.leaderboard))
     app.add_handler(CommandHandler('forcegame', bot.force_game))  # Added for testing
+    app.add_handler(CommandHandler('roll', bot.roll))  # Dice Duel answers are a command
     app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, bot.handle_invite))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_game_response))
     app.add_error_handler(bot.error_handler)
+    return app, bot
+
+
+def _ssl_context(args):
+    if not args.cert:
+        return None  # TLS is terminated by a reverse proxy
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(args.cert, args.key)
+    return context
+
+
+async def _until_signalled():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
 
-    await app.run_polling()
+async def _set_webhook(bot, args, secret_token):
+    await bot.set_webhook(args.webhook_url, secret_token=secret_token, allowed_updates=Update.ALL_TYPES,
+                          max_connections=args.max_connections)
+    logger.info("Webhook set to %s", args.webhook_url)
+
+
+def _webhook_path(args):
+    """The path of args.webhook_url, where Telegram will post updates."""
+    return urllib.parse.urlparse(args.webhook_url).path or '/'
+
+
+async def serve(args):
+    """Run one bot process: polling, a webhook, or a shard worker fed by route()."""
+    app, bot = build_app(concurrency=args.concurrency, polling=not args.webhook_url and args.shard is None,
+                         shard=args.shard or 0, shards=args.shards, content=args.content)
+    intake = None
+    async with app:
+        await bot.open()
+        metrics_server = await serve_metrics(port=args.metrics_port)
+        try:
+            if app.updater is not None:
+                await app.updater.start_polling()
+            else:
+                secret_token = None
+                path = WEBHOOK_PATH  # where route() forwards to
+                if args.shard is None:
+                    secret_token = secrets.token_urlsafe(32)
+                    path = _webhook_path(args)
+                    await _set_webhook(app.bot, args, secret_token)
+                intake = await serve_webhook(queue_updates(app), args.listen, args.port, path=path,
+                                             secret_token=secret_token, ssl=_ssl_context(args))
+            await app.start()
+            await _until_signalled()
+        finally:
+            if app.updater is not None and app.updater.running:
+                await app.updater.stop()
+            if intake is not None:
+                intake.close()
+            if app.running:
+                await app.stop()  # waits for updates in progress
+            metrics_server.close()
+            await bot.close()
+
+
+async def route(args):
+    """Receive the webhook and fan updates out to args.shards worker processes by user_id."""
+    worker_ports = [args.port + 1 + i for i in range(args.shards)]
+    workers = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--shard', str(i), '--shards', str(args.shards),
+                          '--listen', '127.0.0.1', '--port', str(port),
+                          '--metrics-port', str(args.metrics_port + 1 + i), '--concurrency', str(args.concurrency),
+                          '--content', args.content])
+        for i, port in enumerate(worker_ports)
+    ]
+    router = ShardRouter([f'http://127.0.0.1:{port}{WEBHOOK_PATH}' for port in worker_ports])
+    intake = metrics_server = None
+    try:
+        # Inside the try, so a port in use or a bad certificate doesn't leave the workers running
+        await router.start()
+        secret_token = secrets.token_urlsafe(32)
+        intake = await serve_webhook(router.handle, args.listen, args.port, path=_webhook_path(args),
+                                     secret_token=secret_token, ssl=_ssl_context(args))
+        metrics_server = await serve_metrics(port=args.metrics_port)
+        async with Bot(TOKEN) as telegram_bot:
+            await _set_webhook(telegram_bot, args, secret_token)
+        await _until_signalled()
+    finally:
+        if intake is not None:
+            intake.close()
+        await router.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            await asyncio.to_thread(worker.wait)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lanka Legends bot')
+    parser.add_argument('--webhook-url', help='public HTTPS URL for Telegram to post updates to, served at its path; '
+                                              'polls if omitted')
+    parser.add_argument('--listen', default='0.0.0.0', help='webhook listen address')
+    parser.add_argument('--port', type=int, default=8443, help='webhook port; shard workers use the ports after it')
+    parser.add_argument('--cert', help='TLS certificate, unless a reverse proxy terminates TLS')
+    parser.add_argument('--key', help='TLS private key')
+    parser.add_argument('--max-connections', type=int, default=40, help='parallel webhook connections from Telegram')
+    parser.add_argument('--shards', type=int, default=1, help='worker processes, sharded by user_id')
+    parser.add_argument('--shard', type=int, help=argparse.SUPPRESS)  # set on the workers route() starts
+    parser.add_argument('--concurrency', type=int, default=256, help='updates processed at once per process')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT)
+    parser.add_argument('--content', default=CONTENT_PATH, help='game content file, reloaded when it changes')
+    args = parser.parse_args()
+    if args.shards > 1 and not args.webhook_url and args.shard is None:
+        parser.error('--shards needs --webhook-url')
+
+    log_listener = setup_logging()
+    try:
+        asyncio.run(route(args) if args.shards > 1 and args.shard is None else serve(args))
+    finally:
+        log_listener.stop()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    main()
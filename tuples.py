@@ -1,3 +1,158 @@
-n = int(input())
-integer_list = tuple(map(int, input().split()))
-print(hash(integer_list))
+"""Prints hash(tuple(integers)) for each test case on stdin: a count n, then n integers.
+
+Any number of cases can follow one another, laid out on lines however they
+like. Input is read from sys.stdin.buffer in chunks and each case is hashed a
+chunk at a time, so a case of millions of integers never has to be held whole.
+"""
+import itertools
+import sys
+
+CHUNK_SIZE = 1 << 20  # bytes read at a time
+
+# CPython's tuple hash (Objects/tupleobject.c, 3.8+) is an xxHash-style accumulator over the items' hashes
+_MASK = (1 << 64) - 1
+_PRIME_1 = 11400714785074694791
+_PRIME_2 = 14029467366897019727
+_PRIME_5 = 2870177450012600261
+_PRIME_1_INVERSE = pow(_PRIME_1, -1, 1 << 64)
+_PRIME_2_INVERSE = pow(_PRIME_2, -1, 1 << 64)
+_LENGTH_SALT = _PRIME_5 ^ 3527539
+_MINUS_ONE_HASH = 1546275796  # what a tuple hashing to -1 (the error value) hashes to instead
+
+
+def _step(acc, lane):
+    acc = (acc + lane * _PRIME_2) & _MASK
+    acc = ((acc << 31) | (acc >> 33)) & _MASK
+    return (acc * _PRIME_1) & _MASK
+
+
+def _feed(acc, items):
+    """The accumulator after items, one at a time in Python; slow, only for the cases the fast path can't take."""
+    for item in items:
+        acc = _step(acc, hash(item) & _MASK)
+    return acc
+
+
+class _Lane:
+    """An object with a chosen hash, placed first in a tuple to start the accumulator from a carried state."""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return self.value - (1 << 64) if self.value >> 63 else self.value
+
+
+def _seed_for(acc):
+    """The lane that takes the initial accumulator to acc, or None for the one lane no hash can give (-1)."""
+    acc = (acc * _PRIME_1_INVERSE) & _MASK
+    acc = ((acc >> 31) | (acc << 33)) & _MASK
+    lane = ((acc - _PRIME_5) * _PRIME_2_INVERSE) & _MASK
+    return None if lane == _MASK else lane
+
+
+class TupleHasher:
+    """hash(tuple(items)) built from consecutive slices: update() with each, then digest().
+
+    Each slice is hashed by CPython itself as a tuple, after a _Lane that sets the
+    accumulator to where the previous slice left it; the accumulator is then
+    recovered from the result by undoing the length step. So the work per item
+    runs at C speed and only one slice is held at a time.
+    """
+
+    def __init__(self):
+        self._acc = _PRIME_5
+        self._length = 0
+
+    def update(self, items):
+        if not items:
+            return
+        lane = _seed_for(self._acc) if self._length else None
+        if self._length and lane is None:
+            self._acc = _feed(self._acc, items)
+        else:
+            chunk = tuple(items) if lane is None else tuple(itertools.chain((_Lane(lane),), items))
+            digest = hash(chunk) & _MASK
+            if digest == _MINUS_ONE_HASH:
+                # Ambiguous: either a real hash or the stand-in for -1
+                self._acc = _feed(self._acc, items)
+            else:
+                self._acc = (digest - (len(chunk) ^ _LENGTH_SALT)) & _MASK
+        self._length += len(items)
+
+    def digest(self):
+        acc = (self._acc + (self._length ^ _LENGTH_SALT)) & _MASK
+        if acc == _MASK:
+            return _MINUS_ONE_HASH
+        return acc - (1 << 64) if acc >> 63 else acc
+
+
+def _exact():
+    """Whether this interpreter hashes tuples the way TupleHasher assumes (64-bit CPython 3.8+)."""
+    if sys.hash_info.width != 64 or sys.implementation.name != 'cpython':
+        return False
+    sample = tuple(range(-5, 300, 7)) + (1 << 70, -(1 << 62), 'x', None)
+    hasher = TupleHasher()
+    for start in range(0, len(sample), 5):
+        hasher.update(sample[start:start + 5])
+    return hasher.digest() == hash(sample)
+
+
+def read_ints(stream, chunk_size=CHUNK_SIZE):
+    """Lists of the integers in a binary stream, one per chunk read; numbers cut by a chunk edge are rejoined."""
+    tail = b''
+    while chunk := stream.read(chunk_size):
+        chunk = tail + chunk
+        cut = max(chunk.rfind(b' '), chunk.rfind(b'\n'), chunk.rfind(b'\t'), chunk.rfind(b'\r'))
+        if cut < 0:
+            tail = chunk
+            continue
+        tail = chunk[cut + 1:]
+        yield list(map(int, chunk[:cut].split()))
+    if tail.strip():
+        yield list(map(int, tail.split()))
+
+
+def hash_cases(chunks):
+    """hash(tuple) of each case in a stream of integer chunks, as each case completes."""
+    exact = _exact()
+    remaining = None  # integers the current case still needs; None while waiting for a count
+    hasher = collected = None
+    for ints in chunks:
+        position = 0
+        while position < len(ints):
+            if remaining is None:
+                remaining = ints[position]
+                position += 1
+                if remaining < 0:
+                    raise ValueError(f'negative count {remaining}')
+                if position + remaining <= len(ints):
+                    # The whole case is in this chunk, as small ones nearly always are
+                    yield hash(tuple(ints[position:position + remaining]))
+                    position += remaining
+                    remaining = None
+                    continue
+                hasher, collected = (TupleHasher(), None) if exact else (None, [])
+            take = ints[position:position + remaining]
+            if hasher:
+                hasher.update(take)
+            else:
+                collected.extend(take)
+            position += len(take)
+            remaining -= len(take)
+            if not remaining:
+                yield hasher.digest() if hasher else hash(tuple(collected))
+                remaining = None
+    if remaining is not None:
+        raise ValueError(f'input ended {remaining} integers short of the last case')
+
+
+def main():
+    write = sys.stdout.write
+    for digest in hash_cases(read_ints(sys.stdin.buffer)):
+        write(f'{digest}\n')
+
+
+if __name__ == '__main__':
+    main()